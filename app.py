@@ -1,29 +1,193 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-import sqlite3
-import secrets
+from flask import (Flask, render_template, request, redirect, url_for, jsonify, Response,
+                   stream_with_context, g, session, send_from_directory, abort,
+                   before_render_template, template_rendered)
+import mimetypes
 import os
+import re
+import secrets
+import time
 from datetime import datetime
-import pickle
-import numpy as np
-from utils.ml_model import predict_compatibility, train_model, load_model
-from utils.db_helper import init_db, get_db_connection, save_response, get_responses_by_link
+from utils.db_helper import (get_db_connection, get_catalog, get_catalog_questions,
+                             get_pair_link, pool_stats)
+from utils import assets, compaction, drafts, metrics, render_cache, storage, write_behind
+from markupsafe import Markup
+from utils.response_writer import parse_answers, write_responses
+from utils.result_store import get_result
+from utils import score_api
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-this'
 app.config['DATABASE'] = 'data/compatibility.db'
+# Pair data is spread over this many SQLite files (utils/storage.py)
+app.config['SHARDS'] = 1
+# Journal submissions and persist them in the background (utils/write_behind.py)
+app.config['WRITE_BEHIND'] = False
+# 'rows' (one responses row per answer) or 'packed' (utils/packed_storage.py)
+app.config['RESPONSE_STORAGE'] = 'rows'
+# Days before an unanswered share link expires (None = never)
+app.config['LINK_TTL_DAYS'] = compaction.LINK_TTL_DAYS
+# Seconds between background compactions of expired links (None = off;
+# `python -m utils.compaction` can run it out of process instead)
+app.config['COMPACTION_INTERVAL'] = None
 
 # Initialize database on first run
-init_db(app.config['DATABASE'])
+storage.init_storage(app.config['DATABASE'], app.config['SHARDS'])
+# Recover submissions journaled before a crash or restart
+for _shard_path in storage.shard_paths(app.config['DATABASE'], app.config['SHARDS']):
+    try:
+        write_behind.flush(_shard_path)
+    except Exception:
+        # Entries stay journaled; read-through and the next drain retry them
+        app.logger.exception("Write-behind recovery of %s failed", _shard_path)
+
+def asset_manifest():
+    """Built static assets (python -m utils.assets); {} means plain /static files"""
+    manifest, reloaded = assets.current_manifest(app.static_folder)
+    if reloaded:
+        # Cached pages link the previous build's names
+        render_cache.clear()
+    return manifest
+
+def pair_database(link_token):
+    """Database file holding the pair behind link_token"""
+    return storage.pair_database(app.config['DATABASE'], app.config['SHARDS'], link_token)
+
+@app.before_request
+def start_request_timer():
+    """Label all timings recorded during this request with its route"""
+    g.request_started = time.perf_counter()
+    g.route_token = metrics.current_route.set(request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.before_request
+def start_background_jobs():
+    if app.config['COMPACTION_INTERVAL'] and app.config['LINK_TTL_DAYS'] is not None:
+        # The primary holds the drafts, the shards the pairs
+        db_paths = storage.database_paths(app.config['DATABASE'], app.config['SHARDS'])
+        compaction.ensure_compactor(db_paths, app.config['LINK_TTL_DAYS'],
+                                    app.config['COMPACTION_INTERVAL'])
+
+@app.before_request
+def sync_shard_catalogs():
+    # Shards get the primary's catalog again once its version moves on
+    if app.config['SHARDS'] > 1:
+        storage.sync_catalogs(app.config['DATABASE'], app.config['SHARDS'],
+                              get_catalog(app.config['DATABASE'])['version'])
+
+@app.after_request
+def record_request_time(response):
+    if 'request_started' in g:
+        metrics.observe('app_request_seconds', time.perf_counter() - g.request_started,
+                        method=request.method)
+    return response
+
+@app.teardown_request
+def clear_request_route(exc):
+    # Teardown can run twice (stream_with_context responses); a token resets once
+    token = g.pop('route_token', None)
+    if token is not None:
+        metrics.current_route.reset(token)
+
+def _template_render_started(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+def _template_render_finished(sender, template, context, **extra):
+    if g.get('render_started'):
+        metrics.observe('app_template_render_seconds',
+                        time.perf_counter() - g.render_started.pop(), template=template.name)
+
+before_render_template.connect(_template_render_started, app)
+template_rendered.connect(_template_render_finished, app)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this worker's timings and pool stats"""
+    gauges = {}
+    for pool, stats in pool_stats().items():
+        for field, value in stats.items():
+            gauges.setdefault(f'app_db_pool_{field}', []).append(({'pool': pool}, value))
+    return Response(metrics.render_prometheus(gauges),
+                    mimetype='text/plain; version=0.0.4')
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file: its fingerprinted build when there is one"""
+    built = asset_manifest().get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('built_asset', filename=built)
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """Fingerprinted asset, precompressed when the client accepts it, cached for good"""
+    if not assets.is_built(app.static_folder, filename):
+        abort(404)
+    
+    path, encoding = assets.precompressed(app.static_folder, filename, request.accept_encodings)
+    response = send_from_directory(os.path.join(app.static_folder, assets.DIST_DIR), path,
+                                   mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=assets.CACHE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Inputs for which the static questionnaire pages are cached (the
+# statuses are also the only ones pair_links accepts)
+CACHEABLE_STATUSES = ('married', 'unmarried')
+CACHEABLE_GENDERS = ('male', 'female')
+
+def _cached_page(key, template, **context):
+    """Serve a page from the render cache, precompressed and with an ETag"""
+    # A new asset build empties the cache, so pages don't keep the old names
+    asset_manifest()
+    entry = render_cache.get_page((app.config['DATABASE'],) + key,
+                                  lambda: render_template(template, **context))
+    
+    encoding = None
+    if request.headers.get('Accept-Encoding'):
+        encoding = request.accept_encodings.best_match(
+            [e for e in ('br', 'gzip') if entry[e] is not None]
+        )
+    etag = f"{entry['etag']}-{encoding or 'identity'}"
+    
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry[encoding] if encoding else entry['body'], mimetype='text/html')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def _questionnaire(gender=None):
+    """Rendered question list for a gender filter (None = all questions) and its length"""
+    # Any other value gets the neutral list (as get_catalog_questions does);
+    # keying on it would let arbitrary input evict the real fragments
+    if gender is not None and gender not in CACHEABLE_GENDERS:
+        gender = 'both'
+    catalog = get_catalog(app.config['DATABASE'])
+    questions = get_catalog_questions(app.config['DATABASE'], gender)
+    html = render_cache.get_fragment(
+        (app.config['DATABASE'], '_questionnaire.html', gender, None, catalog['version']),
+        lambda: render_template('_questionnaire.html', questions=questions)
+    )
+    return Markup(html), len(questions)
 
 @app.route('/')
 def index():
     """Landing page - choose married/unmarried status"""
-    return render_template('index.html')
+    return _cached_page(('index.html',), 'index.html')
 
 @app.route('/select-gender', methods=['POST'])
 def select_gender():
     """Store relationship status and redirect to gender selection"""
     relationship_status = request.form.get('status')  # 'married' or 'unmarried'
+    if relationship_status in CACHEABLE_STATUSES:
+        return _cached_page(('gender.html', None, relationship_status), 'gender.html',
+                            status=relationship_status)
     return render_template('gender.html', status=relationship_status)
 
 @app.route('/questions', methods=['POST'])
@@ -32,80 +196,151 @@ def questions():
     gender = request.form.get('gender')  # 'male' or 'female'
     status = request.form.get('status')  # 'married' or 'unmarried'
     
-    # Get questions from database
-    conn = get_db_connection(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Fetch questions appropriate for the gender
-    cursor.execute('''
-        SELECT id, question_text, domain, gender_specific 
-        FROM questions 
-        WHERE gender_specific = 'both' OR gender_specific = ?
-        ORDER BY id
-    ''', (gender,))
-    
-    questions = cursor.fetchall()
-    
-    # Fetch options for each question
-    questions_with_options = []
-    for q in questions:
-        cursor.execute('''
-            SELECT id, option_text, weight 
-            FROM options 
-            WHERE question_id = ?
-            ORDER BY id
-        ''', (q['id'],))
-        options = cursor.fetchall()
-        questions_with_options.append({
-            'id': q['id'],
-            'text': q['question_text'],
-            'domain': q['domain'],
-            'options': options
-        })
+    # Question list rendered once per gender and catalog version
+    questionnaire_html, question_count = _questionnaire(gender or 'both')
+    context = dict(questionnaire_html=questionnaire_html, question_count=question_count,
+                   gender=gender, status=status)
     
-    conn.close()
-    
-    return render_template('questions.html', 
-                         questions=questions_with_options,
-                         gender=gender,
-                         status=status)
+    if gender in CACHEABLE_GENDERS and status in CACHEABLE_STATUSES:
+        version = get_catalog(app.config['DATABASE'])['version']
+        return _cached_page(('questions.html', gender, status, version), 'questions.html',
+                            **context)
+    return render_template('questions.html', **context)
+
+# Largest /draft request body accepted (a full questionnaire is a few KB)
+MAX_DRAFT_BYTES = 64 * 1024
+# Drafts remembered per session (oldest forgotten first)
+MAX_SESSION_DRAFTS = 8
+
+LINK_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Draft ids the page generates (see static/js/script.js)
+DRAFT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+def _draft_ref(form):
+    """(draft_id, revision) of this session's draft for a form, or None"""
+    ref = session.get('drafts', {}).get(form)
+    return tuple(ref) if ref else None
+
+def _set_draft_ref(form, ref):
+    refs = dict(session.get('drafts', {}))
+    refs.pop(form, None)
+    if ref is not None:
+        refs[form] = list(ref)
+        while len(refs) > MAX_SESSION_DRAFTS:
+            refs.pop(next(iter(refs)))
+    session['drafts'] = refs
+
+def _with_draft(form, answers, catalog):
+    """Submitted answers on top of the session's saved draft for form"""
+    ref = _draft_ref(form)
+    saved = drafts.load(app.config['DATABASE'], *ref) if ref else None
+    if not saved:
+        return answers
+    
+    # Drop saved answers whose option has since left the catalog
+    options = catalog['options']
+    merged = {question_id: option_id for question_id, option_id in saved.items()
+              if option_id in options and options[option_id]['question_id'] == question_id}
+    merged.update(answers)
+    return list(merged.items())
+
+def _discard_draft(form):
+    ref = _draft_ref(form)
+    if ref:
+        drafts.discard(app.config['DATABASE'], ref[0])
+        _set_draft_ref(form, None)
+
+@app.route('/draft', methods=['GET', 'POST'])
+def draft():
+    """Read (GET) or update (POST, changed answers only) this session's questionnaire draft"""
+    if request.method == 'GET':
+        form = request.args.get('form', '')
+        ref = _draft_ref(form)
+        saved = drafts.load(app.config['DATABASE'], *ref) if ref else None
+        return jsonify(answers={f'q_{q}': o for q, o in (saved or {}).items()})
+    
+    if request.content_length is None:
+        return jsonify(error='Content-Length is required'), 411
+    if request.content_length > MAX_DRAFT_BYTES:
+        return jsonify(error=f'Request body must be at most {MAX_DRAFT_BYTES} bytes'), 413
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('answers'), dict):
+        return jsonify(error='Expected a JSON object with an "answers" object'), 400
+    form = payload.get('form')
+    if form != drafts.INITIATOR_FORM and not (isinstance(form, str)
+                                              and LINK_TOKEN_PATTERN.match(form)):
+        return jsonify(error='Unknown form'), 400
+    
+    catalog = get_catalog(app.config['DATABASE'])
+    try:
+        delta = dict(parse_answers({k: str(v) for k, v in payload['answers'].items()}, catalog))
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+    
+    ref = _draft_ref(form)
+    if ref is None:
+        if form != drafts.INITIATOR_FORM and not get_pair_link(pair_database(form), form):
+            return jsonify(error='Invalid link'), 404
+        # The first save can arrive twice at once (fetch and sendBeacon), both
+        # before the session knows the draft: the page's own id makes them
+        # upsert the same draft instead of creating two
+        draft_id = payload.get('draft_id')
+        if not (isinstance(draft_id, str) and DRAFT_ID_PATTERN.match(draft_id)):
+            draft_id = drafts.new_draft_id()
+        ref = (draft_id, 0)
+    revision = drafts.save(app.config['DATABASE'], ref[0], form, delta)
+    if revision is None:
+        _set_draft_ref(form, None)
+        return jsonify(error='Draft belongs to another form'), 409
+    _set_draft_ref(form, (ref[0], revision))
+    return jsonify(saved=len(delta), revision=revision)
 
 @app.route('/submit-answers', methods=['POST'])
 def submit_answers():
     """Save user's answers and generate shareable link"""
     gender = request.form.get('gender')
     status = request.form.get('status')
+    if status not in CACHEABLE_STATUSES:
+        return render_template('error.html', message='Invalid relationship status')
+    
+    catalog = get_catalog(app.config['DATABASE'])
+    try:
+        answers = parse_answers(request.form, catalog)
+    except ValueError:
+        return render_template('error.html', message='Invalid answers submitted')
+    answers = _with_draft(drafts.INITIATOR_FORM, answers, catalog)
     
     # Generate unique link token
     link_token = secrets.token_urlsafe(16)
     
-    # Save to database
-    conn = get_db_connection(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Create pair link entry
-    cursor.execute('''
-        INSERT INTO pair_links (link_token, relationship_status, created_at, is_complete)
-        VALUES (?, ?, ?, ?)
-    ''', (link_token, status, datetime.now().isoformat(), 0))
-    
-    pair_id = cursor.lastrowid
+    if app.config['WRITE_BEHIND']:
+        write_behind.submit_pair(pair_database(link_token), link_token, status, answers,
+                                 app.config['RESPONSE_STORAGE'])
+        _discard_draft(drafts.INITIATOR_FORM)
+        return render_template('link_generated.html',
+                             link=request.host_url + 'partner/' + link_token,
+                             status=status)
     
-    # Save user responses
-    answers = {}
-    for key, value in request.form.items():
-        if key.startswith('q_'):
-            question_id = int(key.split('_')[1])
-            option_id = int(value)
-            answers[question_id] = option_id
-            
-            cursor.execute('''
-                INSERT INTO responses (pair_id, user_number, question_id, option_id, response_time)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (pair_id, 1, question_id, option_id, datetime.now().isoformat()))
-    
-    conn.commit()
-    conn.close()
+    # Save pair link and all responses in one short transaction
+    conn = get_db_connection(pair_database(link_token))
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            INSERT INTO pair_links (link_token, relationship_status, created_at, is_complete)
+            VALUES (?, ?, ?, ?)
+        ''', (link_token, status, datetime.now().isoformat(), 0))
+        
+        pair_id = cursor.lastrowid
+        write_responses(cursor, catalog, pair_id, 1, answers,
+                        storage=app.config['RESPONSE_STORAGE'])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    _discard_draft(drafts.INITIATOR_FORM)
     
     # Generate shareable link
     partner_link = request.host_url + 'partner/' + link_token
@@ -117,167 +352,122 @@ def submit_answers():
 @app.route('/partner/<link_token>')
 def partner_questions(link_token):
     """Partner accesses questionnaire via shared link"""
-    conn = get_db_connection(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Verify link exists and is not complete
-    cursor.execute('''
-        SELECT id, relationship_status, is_complete 
-        FROM pair_links 
-        WHERE link_token = ?
-    ''', (link_token,))
-    
-    link_data = cursor.fetchone()
-    
+    write_behind.read_through(pair_database(link_token))
+    link_data = get_pair_link(pair_database(link_token), link_token)
+    return render_partner_page(link_token, link_data)
+
+def render_partner_page(link_token, link_data):
+    """Partner questionnaire, or an error page for unknown/used links"""
     if not link_data:
-        conn.close()
         return render_template('error.html', message='Invalid link')
     
     if link_data['is_complete']:
-        conn.close()
         return render_template('error.html', message='This link has already been used')
     
-    # Get questions
-    cursor.execute('''
-        SELECT id, question_text, domain, gender_specific 
-        FROM questions 
-        ORDER BY id
-    ''')
-    
-    questions = cursor.fetchall()
-    
-    questions_with_options = []
-    for q in questions:
-        cursor.execute('''
-            SELECT id, option_text, weight 
-            FROM options 
-            WHERE question_id = ?
-            ORDER BY id
-        ''', (q['id'],))
-        options = cursor.fetchall()
-        questions_with_options.append({
-            'id': q['id'],
-            'text': q['question_text'],
-            'domain': q['domain'],
-            'options': options
-        })
+    if compaction.is_expired(link_data['created_at'], app.config['LINK_TTL_DAYS']):
+        return render_template('error.html', message='This link has expired')
     
-    conn.close()
+    questionnaire_html, question_count = _questionnaire()
     
     return render_template('partner_questions.html',
-                         questions=questions_with_options,
+                         questionnaire_html=questionnaire_html,
+                         question_count=question_count,
                          link_token=link_token,
                          status=link_data['relationship_status'])
 
 @app.route('/submit-partner-answers', methods=['POST'])
 def submit_partner_answers():
-    """Save partner's answers and redirect to results"""
+    """Save partner's answers (once per link) and redirect to results"""
     link_token = request.form.get('link_token')
+    if not link_token:
+        return render_template('error.html', message='Invalid link')
+    db_path = pair_database(link_token)
+    results_url = url_for('show_results', link_token=link_token)
     
-    conn = get_db_connection(app.config['DATABASE'])
+    write_behind.read_through(db_path)
+    link_data = get_pair_link(db_path, link_token)
+    if not link_data:
+        return render_template('error.html', message='Invalid link')
+    # A double click or second tab: the answers are already in
+    if link_data['is_complete']:
+        return redirect(results_url)
+    if compaction.is_expired(link_data['created_at'], app.config['LINK_TTL_DAYS']):
+        return render_template('error.html', message='This link has expired')
+    
+    catalog = get_catalog(app.config['DATABASE'])
+    try:
+        answers = parse_answers(request.form, catalog)
+    except ValueError:
+        return render_template('error.html', message='Invalid answers submitted')
+    answers = _with_draft(link_token, answers, catalog)
+    
+    if app.config['WRITE_BEHIND']:
+        # The drain claims the link the same way, so a racing duplicate is skipped there
+        write_behind.submit_partner(db_path, link_token, answers, app.config['RESPONSE_STORAGE'])
+        _discard_draft(link_token)
+        return redirect(results_url)
+    
+    conn = get_db_connection(db_path)
     cursor = conn.cursor()
+    try:
+        # Claim the link and save the answers in one write transaction;
+        # of two racing submissions only one sees is_complete = 0
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('UPDATE pair_links SET is_complete = 1 WHERE id = ? AND is_complete = 0',
+                       (link_data['id'],))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return redirect(results_url)
+        write_responses(cursor, catalog, link_data['id'], 2, answers,
+                        storage=app.config['RESPONSE_STORAGE'])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    _discard_draft(link_token)
     
-    # Get pair_id from link_token
-    cursor.execute('SELECT id FROM pair_links WHERE link_token = ?', (link_token,))
-    pair_data = cursor.fetchone()
-    pair_id = pair_data['id']
-    
-    # Save partner responses
-    for key, value in request.form.items():
-        if key.startswith('q_'):
-            question_id = int(key.split('_')[1])
-            option_id = int(value)
-            
-            cursor.execute('''
-                INSERT INTO responses (pair_id, user_number, question_id, option_id, response_time)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (pair_id, 2, question_id, option_id, datetime.now().isoformat()))
-    
-    # Mark link as complete
-    cursor.execute('UPDATE pair_links SET is_complete = 1 WHERE id = ?', (pair_id,))
-    
-    conn.commit()
-    conn.close()
-    
-    # Redirect to results
-    return redirect(url_for('show_results', link_token=link_token))
+    return redirect(results_url)
 
 @app.route('/results/<link_token>')
 def show_results(link_token):
     """Calculate and display compatibility/divorce prediction"""
-    conn = get_db_connection(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Get pair data
-    cursor.execute('''
-        SELECT id, relationship_status 
-        FROM pair_links 
-        WHERE link_token = ?
-    ''', (link_token,))
-    pair_data = cursor.fetchone()
-    pair_id = pair_data['id']
-    status = pair_data['relationship_status']
-    
-    # Get both users' responses
-    cursor.execute('''
-        SELECT r.user_number, r.question_id, o.weight, q.domain
-        FROM responses r
-        JOIN options o ON r.option_id = o.id
-        JOIN questions q ON r.question_id = q.id
-        WHERE r.pair_id = ?
-        ORDER BY r.user_number, r.question_id
-    ''', (pair_id,))
-    
-    responses = cursor.fetchall()
-    
-    # Prepare features for ML model
-    
-    user1_scores = {}
-    user2_scores = {}
-    user1_counts = {}
-    user2_counts = {}
-
-    for resp in responses:
-        domain = resp['domain']
-        weight = resp['weight']
-
-        if resp['user_number'] == 1:
-            user1_scores[domain] = user1_scores.get(domain, 0) + weight
-            user1_counts[domain] = user1_counts.get(domain, 0) + 1
-        else:
-            user2_scores[domain] = user2_scores.get(domain, 0) + weight
-            user2_counts[domain] = user2_counts.get(domain, 0) + 1
-
-# FIX: Calculate average score per domain (to keep scores in 0-4 range)
-    for domain in user1_scores.keys():
-        if user1_counts[domain] > 0:
-            user1_scores[domain] = user1_scores[domain] / user1_counts[domain]
-
-    for domain in user2_scores.keys():
-        if user2_counts[domain] > 0:
-            user2_scores[domain] = user2_scores[domain] / user2_counts[domain]
-    
-    # Make prediction
-    prediction, probability, explanation = predict_compatibility(
-        user1_scores, user2_scores, status
-    )
-    
-    # Save results
-    cursor.execute('''
-        INSERT INTO results (pair_id, prediction_label, probability_score, explanation, predicted_at)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (pair_id, prediction, probability, explanation, datetime.now().isoformat()))
-    
-    conn.commit()
-    conn.close()
+    write_behind.read_through(pair_database(link_token))
+    return render_results_page(get_result(pair_database(link_token), link_token))
+
+def render_results_page(result):
+    """Results page for a get_result() value, or an error page when it is None"""
+    if result is None:
+        return render_template('error.html', message='Invalid link')
     
     return render_template('result.html',
-                         prediction=prediction,
-                         probability=probability,
-                         explanation=explanation,
-                         status=status,
-                         user1_scores=user1_scores,
-                         user2_scores=user2_scores)
+                         prediction=result['prediction'],
+                         probability=result['probability'],
+                         explanation=result['explanation'],
+                         status=result['status'],
+                         user1_scores=result['user1_scores'],
+                         user2_scores=result['user2_scores'])
+
+@app.route('/api/v1/score', methods=['POST'])
+def api_score():
+    """Score a batch of pairs and stream one NDJSON line per pair"""
+    if request.content_length is None:
+        return jsonify(error='Content-Length is required'), 411
+    if request.content_length > score_api.MAX_REQUEST_BYTES:
+        return jsonify(error=f'Request body must be at most {score_api.MAX_REQUEST_BYTES} bytes'), 413
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('pairs'), list):
+        return jsonify(error='Expected a JSON object with a "pairs" list'), 400
+    
+    pairs = payload['pairs']
+    if len(pairs) > score_api.MAX_PAIRS:
+        return jsonify(error=f'At most {score_api.MAX_PAIRS} pairs per request'), 413
+    
+    catalog = get_catalog(app.config['DATABASE'])
+    return Response(stream_with_context(score_api.score_pairs(pairs, catalog)),
+                    mimetype='application/x-ndjson')
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,224 @@
+"""
+ASGI entry point for async serving
+
+    uvicorn asgi:application --workers 4
+
+The share-link routes (/partner/<token>, /results/<token>) are async
+handlers: their database work is awaited on the bounded executor in
+utils.async_db, so waiting on SQLite never pins a worker. They still run
+inside a Flask request context with the app's before/after/teardown hooks
+and error handling. All other routes are the regular Flask views, bridged
+through the same executor. Request bodies are read on the event loop, up
+to the same limits the views enforce, and responses are sent chunk by
+chunk as the app yields them, so slow clients don't hold threads and
+NDJSON stays streamed. The sync deployment (gunicorn app:app) is
+unchanged.
+"""
+import contextvars
+import json
+import re
+import sys
+from io import BytesIO
+
+from app import (MAX_DRAFT_BYTES, app, pair_database, render_partner_page,
+                 render_results_page)
+from utils import async_db, score_api, write_behind
+
+ASYNC_ROUTES = [
+    (re.compile(r'^/partner/([^/]+)$'), '/partner/<link_token>'),
+    (re.compile(r'^/results/([^/]+)$'), '/results/<link_token>'),
+]
+
+# Largest request body buffered for a route without a limit of its own
+MAX_BODY_BYTES = 1024 * 1024
+
+# POST routes that require a Content-Length, and the largest body each
+# accepts; checked here so an oversized body is never buffered
+BODY_LIMITS = {
+    '/api/v1/score': score_api.MAX_REQUEST_BYTES,
+    '/draft': MAX_DRAFT_BYTES,
+}
+
+def _environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP scope"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        # A body sent without Content-Length (chunked) is read to the end,
+        # as gunicorn does; the client's Content-Length is passed as sent
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+def _content_length(scope):
+    """The request's Content-Length as an int, or None when it has none"""
+    for name, value in scope.get('headers', []):
+        if name.lower() == b'content-length':
+            return int(value)
+    return None
+
+async def _read_body(receive, limit):
+    """Request body, or None as soon as it grows past limit bytes"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def _send_start(send, status, headers):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+
+async def _send_response(send, status, headers, body):
+    await _send_start(send, status, headers)
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _send_error(send, status, message):
+    """JSON error in the same shape the views return"""
+    body = (json.dumps({'error': message}) + '\n').encode('utf-8')
+    await _send_response(send, status, [('Content-Type', 'application/json'),
+                                        ('Content-Length', str(len(body)))], body)
+
+async def _share_page(route, link_token):
+    """Rendered partner or results page for link_token"""
+    db_path = pair_database(link_token)
+    if write_behind.has_pending(db_path):
+        await async_db.run(write_behind.flush, db_path)
+    if route == '/partner/<link_token>':
+        link_data = await async_db.get_pair_link(db_path, link_token)
+        # Refresh the catalog off-loop; rendering then only reads memory
+        await async_db.get_catalog(app.config['DATABASE'])
+        return render_partner_page(link_token, link_data)
+    result = await async_db.get_result(db_path, link_token)
+    return render_results_page(result)
+
+async def _dispatch_share_page(scope, route, link_token):
+    """Flask's request handling around _share_page; returns the finished response"""
+    ctx = app.request_context(_environ(scope, b''))
+    ctx.push()
+    error = None
+    try:
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await _share_page(route, link_token)
+        except Exception as exc:
+            rv = app.handle_user_exception(exc)
+        return app.finalize_request(rv)
+    except Exception as exc:
+        error = exc
+        return app.handle_exception(exc)
+    finally:
+        ctx.pop(error)
+
+async def _async_route(scope, send, route, link_token):
+    """Async handler for the share-link pages"""
+    try:
+        response = await _dispatch_share_page(scope, route, link_token)
+        body = b'' if scope['method'] == 'HEAD' else response.get_data()
+    except Exception:
+        # The app propagated the error (debug/testing) or its error handling failed
+        await _send_response(send, 500, [('Content-Type', 'text/plain; charset=utf-8')],
+                             b'Internal Server Error')
+        raise
+    await _send_response(send, response.status_code, response.headers.to_wsgi_list(), body)
+
+async def _wsgi_route(scope, receive, send):
+    """Run a regular Flask view on the bounded executor"""
+    try:
+        content_length = _content_length(scope)
+    except ValueError:
+        return await _send_error(send, 400, 'Invalid Content-Length')
+    limit = MAX_BODY_BYTES
+    if scope['method'] == 'POST' and scope['path'] in BODY_LIMITS:
+        if content_length is None:
+            return await _send_error(send, 411, 'Content-Length is required')
+        limit = BODY_LIMITS[scope['path']]
+    if content_length is not None and content_length > limit:
+        return await _send_error(send, 413, f'Request body must be at most {limit} bytes')
+    body = await _read_body(receive, limit)
+    if body is None:
+        return await _send_error(send, 413, f'Request body must be at most {limit} bytes')
+    
+    environ = _environ(scope, body)
+    response_start = {}
+    
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = headers
+    
+    # One context for the whole exchange: Flask's request context and the
+    # route label are pushed and popped in it, even when the app yields the
+    # body from a generator across several executor calls
+    context = contextvars.copy_context()
+    result = await async_db.run(context.run, app, environ, start_response)
+    started = False
+    try:
+        chunks = iter(result)
+        while True:
+            chunk = await async_db.run(context.run, next, chunks, None)
+            if chunk is None:
+                break
+            if not started:
+                await _send_start(send, response_start['status'], response_start['headers'])
+                started = True
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        if hasattr(result, 'close'):
+            await async_db.run(context.run, result.close)
+    if not started:
+        await _send_start(send, response_start['status'], response_start['headers'])
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            async_db.shutdown()
+            write_behind.stop_drainers()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    
+    if scope['method'] in ('GET', 'HEAD'):
+        for pattern, route in ASYNC_ROUTES:
+            match = pattern.match(scope['path'])
+            if match:
+                return await _async_route(scope, send, route, match.group(1))
+    return await _wsgi_route(scope, receive, send)
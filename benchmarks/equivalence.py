@@ -0,0 +1,230 @@
+"""
+Equivalence check for the rule-table scorer
+
+Usage:
+    python benchmarks/equivalence.py [--random 30000] [--seed 0]
+
+Compares predict_batch (utils/scoring_rules.json driven) with a frozen
+copy of the original if/elif predict_compatibility: label, rounded
+probability and explanation must match exactly, both pair by pair and
+as one batch. Inputs are random score pairs, pairs whose combined score
+lands exactly on (or right next to) every band cut, empty score dicts,
+and statuses the rule table doesn't know. Exits non-zero on any
+mismatch. A deliberate change to bands or labels bumps the rule table's
+version; the check then refuses to run until the frozen copy and
+FROZEN_RULES_VERSION are updated to match.
+"""
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.ml_model import DOMAINS, RULES_VERSION, predict_batch, scores_to_matrix
+
+# Rule table version the frozen scorer below is equivalent to
+FROZEN_RULES_VERSION = 'rules-v1'
+
+STATUSES = ['married', 'unmarried', None, '', 'Married', 'divorced', 'engaged']
+
+def _combined_score(user1_scores, user2_scores):
+    """Combined score exactly as the frozen scorer computes it"""
+    domains = ['communication', 'trust', 'finance', 'intimacy',
+               'family', 'personal_growth', 'commitment']
+    avg_score = sum(user1_scores.values()) + sum(user2_scores.values())
+    total_diff = sum(abs(user1_scores.get(d, 0) - user2_scores.get(d, 0)) for d in domains)
+    similarity = 1 - (total_diff / (len(domains) * 4))
+    return (avg_score / (len(domains) * 8)) * 0.6 + similarity * 0.4
+
+def frozen_predict_compatibility(user1_scores, user2_scores, relationship_status):
+    """The original if/elif scorer, kept verbatim as the reference"""
+    domains = ['communication', 'trust', 'finance', 'intimacy',
+               'family', 'personal_growth', 'commitment']
+
+    # Calculate metrics
+    total_user1 = sum(user1_scores.values())
+    total_user2 = sum(user2_scores.values())
+    avg_score = (total_user1 + total_user2)
+    max_possible = len(domains) * 4 * 2  # max score per domain * 2 users
+
+    # Calculate similarity (lower difference = higher compatibility)
+    total_diff = sum(abs(user1_scores.get(d, 0) - user2_scores.get(d, 0)) for d in domains)
+    max_diff = len(domains) * 4
+    similarity = 1 - (total_diff / max_diff)
+
+    # Combined score (weighted average of absolute scores and similarity)
+    combined_score = (avg_score / (len(domains) * 8)) * 0.6 + similarity * 0.4
+
+    # Identify problem areas (low scores or big differences)
+    problem_domains = []
+    for domain in domains:
+        avg_domain = (user1_scores.get(domain, 0) + user2_scores.get(domain, 0)) / 2
+        diff = abs(user1_scores.get(domain, 0) - user2_scores.get(domain, 0))
+
+        if avg_domain < 2.5 or diff > 2:
+            problem_domains.append(domain)
+
+    # Generate prediction based on relationship status
+    if relationship_status == 'unmarried':
+        # Compatibility prediction for unmarried couples
+        if combined_score >= 0.75:
+            prediction = "Excellent Compatibility"
+            probability = combined_score
+            explanation = f"You both show strong alignment across {len(domains) - len(problem_domains)} out of {len(domains)} key relationship domains. "
+            if problem_domains:
+                explanation += f"Consider discussing: {', '.join(problem_domains)} for even better harmony."
+            else:
+                explanation += "Keep nurturing your connection!"
+        elif combined_score >= 0.60:
+            prediction = "Good Compatibility"
+            probability = combined_score
+            explanation = f"You have a solid foundation with good alignment in most areas. "
+            if problem_domains:
+                explanation += f"Work together on: {', '.join(problem_domains)} to strengthen your relationship."
+        elif combined_score >= 0.45:
+            prediction = "Moderate Compatibility"
+            probability = combined_score
+            explanation = f"Your relationship has potential, but requires effort. "
+            explanation += f"Focus on improving: {', '.join(problem_domains[:3])} through open communication and compromise."
+        else:
+            prediction = "Low Compatibility"
+            probability = combined_score
+            explanation = f"Significant differences detected in: {', '.join(problem_domains)}. "
+            explanation += "Consider couples counseling or have honest conversations about long-term compatibility."
+
+    else:  # married
+        # Divorce risk prediction for married couples
+        if combined_score >= 0.70:
+            prediction = "Low Divorce Risk"
+            probability = 1 - combined_score  # inverse for risk
+            explanation = f"Your marriage shows strong health across key areas. "
+            if problem_domains:
+                explanation += f"Continue working on: {', '.join(problem_domains)} to maintain this positive trajectory."
+            else:
+                explanation += "Keep investing in your relationship!"
+        elif combined_score >= 0.55:
+            prediction = "Moderate Divorce Risk"
+            probability = 1 - combined_score
+            explanation = f"Your marriage has areas of concern. "
+            explanation += f"Priority areas to address: {', '.join(problem_domains[:3])}. Consider marriage counseling to strengthen your bond."
+        elif combined_score >= 0.40:
+            prediction = "High Divorce Risk"
+            probability = 1 - combined_score
+            explanation = f"Your marriage shows significant stress in: {', '.join(problem_domains)}. "
+            explanation += "Professional intervention is strongly recommended. Many marriages can be saved with proper support."
+        else:
+            prediction = "Critical Divorce Risk"
+            probability = 1 - combined_score
+            explanation = f"Your marriage faces serious challenges across multiple domains: {', '.join(problem_domains)}. "
+            explanation += "Immediate professional help is crucial. Both partners must be committed to making changes."
+
+    # Add specific domain insights
+    strength_domains = [d for d in domains if d not in problem_domains]
+    if strength_domains:
+        explanation += f"\n\nStrengths: {', '.join(strength_domains)}."
+
+    return prediction, round(probability * 100, 1), explanation
+
+CUTS = (0.40, 0.45, 0.55, 0.60, 0.70, 0.75)
+
+def cut_cases():
+    """
+    Score pairs on and around every band cut
+
+    Searches uniform per-user scores (and one odd domain) on a 1/24 grid
+    and keeps, per cut, every pair landing exactly on it plus the nearest
+    pair on each side. Returns (cases, cuts hit exactly).
+    """
+    candidates = []
+    grid = [k / 24 for k in range(97)]
+    for a in grid:
+        for b in grid:
+            candidates.append(({d: a for d in DOMAINS}, {d: b for d in DOMAINS}))
+        for odd in grid[::4]:
+            user1 = {d: a for d in DOMAINS}
+            user1[DOMAINS[0]] = odd
+            candidates.append((user1, {d: a for d in DOMAINS}))
+
+    cases = []
+    exact = set()
+    for cut in CUTS:
+        below = above = None
+        for user1, user2 in candidates:
+            score = _combined_score(user1, user2)
+            if score == cut:
+                cases.append((user1, user2))
+                exact.add(cut)
+            elif score < cut and (below is None or score > below[0]):
+                below = (score, user1, user2)
+            elif score > cut and (above is None or score < above[0]):
+                above = (score, user1, user2)
+        cases.extend((user1, user2) for _, user1, user2 in filter(None, (below, above)))
+    return cases, exact
+
+def random_cases(count, rng):
+    """Random per-domain averages; some domains missing, some integral"""
+    cases = []
+    for _ in range(count):
+        pair = []
+        for _ in range(2):
+            scores = {}
+            for d in DOMAINS:
+                roll = rng.random()
+                if roll < 0.05:
+                    continue
+                scores[d] = rng.randint(0, 4) if roll < 0.3 else rng.uniform(0, 4)
+            pair.append(scores)
+        cases.append(tuple(pair))
+    return cases
+
+def check(cases):
+    """Compare every case under every status; returns a list of mismatches"""
+    mismatches = []
+    statuses = [status for _ in cases for status in STATUSES]
+    expanded = [case for case in cases for _ in STATUSES]
+    expected = [frozen_predict_compatibility(user1, user2, status)
+                for (user1, user2), status in zip(expanded, statuses)]
+
+    for (user1, user2), status, want in zip(expanded, statuses, expected):
+        got = predict_batch(scores_to_matrix(user1, user2), status)[0]
+        if tuple(got) != want:
+            mismatches.append(('single', user1, user2, status, want, got))
+
+    matrix = scores_to_matrix({}, {}).repeat(len(expanded), axis=0)
+    for i, (user1, user2) in enumerate(expanded):
+        matrix[i] = scores_to_matrix(user1, user2)[0]
+    for (user1, user2), status, want, got in zip(expanded, statuses, expected,
+                                                 predict_batch(matrix, statuses)):
+        if tuple(got) != want:
+            mismatches.append(('batch', user1, user2, status, want, got))
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the rule table against the frozen scorer')
+    parser.add_argument('--random', type=int, default=30000, help='random score pairs')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if RULES_VERSION != FROZEN_RULES_VERSION:
+        print(f"FAIL: rule table is {RULES_VERSION}, frozen scorer matches {FROZEN_RULES_VERSION}")
+        return 1
+
+    boundary, exact = cut_cases()
+    cases = [({}, {})] + boundary + random_cases(args.random, random.Random(args.seed))
+    mismatches = check(cases)
+
+    print(f"{len(cases)} score pairs x {len(STATUSES)} statuses, single and batch "
+          f"({len(boundary)} around cuts, exact hits on {sorted(exact)})")
+    for kind, user1, user2, status, want, got in mismatches[:5]:
+        print(f"  {kind} status={status!r} user1={user1} user2={user2}\n"
+              f"    expected {want!r}\n    got      {tuple(got)!r}")
+    if mismatches:
+        print(f"FAIL: {len(mismatches)} mismatches")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
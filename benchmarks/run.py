@@ -0,0 +1,282 @@
+"""
+Offline load test and micro-benchmarks
+
+Usage:
+    python benchmarks/run.py [--pairs 2000] [--flows 200] [--concurrency 8]
+                             [--micro-iterations 5000] [--save NAME]
+                             [--compare NAME] [--tolerance 0.2]
+                             [--storage rows|packed] [--shards 1]
+                             [--writes 2000] [--write-processes 4]
+
+Seeds a synthetic compatibility.db in a scratch directory, drives the full
+questionnaire flow (/questions -> /submit-answers -> /partner/<token> ->
+/submit-partner-answers -> /results/<token>) through Flask's test client
+from several threads, and micro-benchmarks the scorer. Reports throughput
+and p50/p95/p99 latency per route. --save writes the numbers to
+benchmarks/baselines/NAME.json; --compare reports the change against a
+saved baseline and exits non-zero if any p95 regressed by more than the
+tolerance. --shards spreads pair data over N SQLite files; the write
+benchmark (complete pairs committed from several processes at once) shows
+how write throughput scales with it.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, 'benchmarks', 'baselines')
+sys.path.insert(0, ROOT)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(samples, wall_seconds):
+    """Throughput and latency percentiles (ms) for a list of durations in seconds"""
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'ops_per_sec': round(len(ordered) / wall_seconds, 1) if wall_seconds else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3)
+    }
+
+def seed_database(db_path, pairs, completed_fraction=0.8, storage='rows', shards=1):
+    """Fill db_path (or its shards) with `pairs` synthetic pairs through the normal write path"""
+    from utils.db_helper import get_db_connection, get_catalog
+    from utils.response_writer import write_responses
+    from utils.storage import shard_paths, shard_index
+    
+    catalog = get_catalog(db_path)
+    questions = catalog['questions']
+    conns = [get_db_connection(path) for path in shard_paths(db_path, shards)]
+    now = datetime.now().isoformat()
+    for _ in range(pairs):
+        complete = random.random() < completed_fraction
+        link_token = secrets.token_urlsafe(16)
+        cursor = conns[shard_index(link_token, shards)].cursor()
+        cursor.execute('''
+            INSERT INTO pair_links (link_token, relationship_status, created_at, is_complete)
+            VALUES (?, ?, ?, ?)
+        ''', (link_token, random.choice(['married', 'unmarried']), now, int(complete)))
+        pair_id = cursor.lastrowid
+        for user_number in ((1, 2) if complete else (1,)):
+            answers = [(q['id'], random.choice(q['options'])['id']) for q in questions]
+            write_responses(cursor, catalog, pair_id, user_number, answers, now, storage)
+    for conn in conns:
+        conn.commit()
+        conn.close()
+
+def _database_bytes(db_path):
+    """Size of the database including its uncheckpointed WAL"""
+    wal_path = db_path + '-wal'
+    return os.path.getsize(db_path) + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+
+def _answers_form(page_html):
+    """Pick a random option for every question rendered on a page"""
+    choices = {}
+    for question_id, option_id in re.findall(r'name="q_(\d+)" value="(\d+)"', page_html):
+        choices.setdefault(question_id, []).append(option_id)
+    return {f'q_{question_id}': random.choice(options) for question_id, options in choices.items()}
+
+def run_flow(client, timings):
+    """One couple going through every route; appends (route, seconds) to timings"""
+    def timed(route, call):
+        started = time.perf_counter()
+        response = call()
+        timings.append((route, time.perf_counter() - started))
+        if response.status_code >= 400:
+            raise RuntimeError(f"{route} returned {response.status_code}")
+        return response
+    
+    status = random.choice(['married', 'unmarried'])
+    gender = random.choice(['male', 'female'])
+    page = timed('/questions', lambda: client.post('/questions', data={'gender': gender, 'status': status}))
+    form = {'gender': gender, 'status': status, **_answers_form(page.get_data(as_text=True))}
+    page = timed('/submit-answers', lambda: client.post('/submit-answers', data=form))
+    link_token = re.search(r'/partner/([\w-]+)', page.get_data(as_text=True)).group(1)
+    page = timed('/partner/<token>', lambda: client.get(f'/partner/{link_token}'))
+    form = {'link_token': link_token, **_answers_form(page.get_data(as_text=True))}
+    timed('/submit-partner-answers', lambda: client.post('/submit-partner-answers', data=form))
+    timed('/results/<token>', lambda: client.get(f'/results/{link_token}'))
+    timed('/results/<token> (repeat)', lambda: client.get(f'/results/{link_token}'))
+
+def bench_routes(app, flows, concurrency):
+    """Run `flows` full flows from `concurrency` threads"""
+    timings = []
+    
+    def worker(count):
+        client = app.test_client()
+        for _ in range(count):
+            run_flow(client, timings)
+    
+    per_worker = [flows // concurrency + (1 if i < flows % concurrency else 0)
+                  for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(worker, per_worker))
+    wall = time.perf_counter() - started
+    
+    by_route = {}
+    for route, seconds in timings:
+        by_route.setdefault(route, []).append(seconds)
+    report = {route: summarize(samples, wall) for route, samples in by_route.items()}
+    report['flow'] = {'count': flows, 'ops_per_sec': round(flows / wall, 1)}
+    return report
+
+def _write_pairs(job):
+    """Worker process: commit `count` complete pairs one transaction each"""
+    db_path, shards, count, storage = job
+    from utils.db_helper import get_db_connection, get_catalog
+    from utils.response_writer import write_responses
+    from utils.storage import pair_database
+    
+    catalog = get_catalog(db_path)
+    questions = catalog['questions']
+    samples = []
+    for _ in range(count):
+        link_token = secrets.token_urlsafe(16)
+        started = time.perf_counter()
+        conn = get_db_connection(pair_database(db_path, shards, link_token))
+        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        cursor.execute('''
+            INSERT INTO pair_links (link_token, relationship_status, created_at, is_complete)
+            VALUES (?, ?, ?, 1)
+        ''', (link_token, random.choice(['married', 'unmarried']), now))
+        pair_id = cursor.lastrowid
+        for user_number in (1, 2):
+            answers = [(q['id'], random.choice(q['options'])['id']) for q in questions]
+            write_responses(cursor, catalog, pair_id, user_number, answers, now, storage)
+        conn.commit()
+        conn.close()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def bench_writes(db_path, shards, writes, processes, storage='rows'):
+    """Commit `writes` complete pairs from `processes` processes at once"""
+    jobs = [(db_path, shards, writes // processes + (1 if i < writes % processes else 0), storage)
+            for i in range(processes)]
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        samples = [s for worker_samples in pool.map(_write_pairs, jobs) for s in worker_samples]
+    return {f'pair writes ({shards} shard{"s" if shards > 1 else ""})':
+            summarize(samples, time.perf_counter() - started)}
+
+def bench_scorer(iterations):
+    """Per-call latency of create_features/predict_compatibility and batch throughput"""
+    import numpy as np
+    from utils.ml_model import DOMAINS, create_features, predict_compatibility, score_batch
+    
+    inputs = [({d: random.uniform(1, 4) for d in DOMAINS}, {d: random.uniform(1, 4) for d in DOMAINS},
+               random.choice(['married', 'unmarried'])) for _ in range(iterations)]
+    report = {}
+    for name, fn in (('create_features', lambda u1, u2, s: create_features(u1, u2)),
+                     ('predict_compatibility', predict_compatibility)):
+        samples = []
+        started = time.perf_counter()
+        for user1, user2, status in inputs:
+            call_started = time.perf_counter()
+            fn(user1, user2, status)
+            samples.append(time.perf_counter() - call_started)
+        report[name] = summarize(samples, time.perf_counter() - started)
+    
+    scores = np.random.uniform(1, 4, (100000, 2, len(DOMAINS)))
+    statuses = np.random.choice(['married', 'unmarried'], 100000)
+    started = time.perf_counter()
+    score_batch(scores, statuses)
+    wall = time.perf_counter() - started
+    report['score_batch (100k)'] = {'count': 100000, 'ops_per_sec': round(100000 / wall, 1),
+                                    'p50_ms': round(wall * 1000, 3)}
+    return report
+
+def print_report(report):
+    print(f"{'benchmark':<34}{'count':>8}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in report.items():
+        print(f"{name:<34}{stats['count']:>8}{stats['ops_per_sec']:>12}"
+              f"{stats.get('p50_ms', ''):>10}{stats.get('p95_ms', ''):>10}{stats.get('p99_ms', ''):>10}")
+
+def compare(report, baseline, tolerance):
+    """Print p95 changes against a baseline; returns True if nothing regressed"""
+    ok = True
+    for name, stats in report.items():
+        before = baseline.get(name, {}).get('p95_ms')
+        after = stats.get('p95_ms')
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        flag = ''
+        if change > tolerance:
+            flag = '  REGRESSION'
+            ok = False
+        print(f"{name:<34} p95 {before:>9.3f} -> {after:>9.3f} ms ({change:+.1%}){flag}")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark routes and scorer')
+    parser.add_argument('--pairs', type=int, default=2000, help='synthetic pairs to seed')
+    parser.add_argument('--flows', type=int, default=200, help='full flows to drive')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--micro-iterations', type=int, default=5000)
+    parser.add_argument('--save', metavar='NAME', help='save results as a baseline')
+    parser.add_argument('--compare', metavar='NAME', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 regression')
+    parser.add_argument('--storage', choices=['rows', 'packed'], default='rows',
+                        help='response storage format')
+    parser.add_argument('--shards', type=int, default=1, help='SQLite files for pair data')
+    parser.add_argument('--writes', type=int, default=2000, help='pairs for the write benchmark')
+    parser.add_argument('--write-processes', type=int, default=4,
+                        help='concurrent writer processes')
+    args = parser.parse_args(argv)
+    
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.chdir(workdir)
+    import app as app_module
+    from utils.storage import init_storage, shard_paths
+    
+    db_path = os.path.join(workdir, 'data', 'compatibility.db')
+    app_module.app.config['DATABASE'] = db_path
+    app_module.app.config['RESPONSE_STORAGE'] = args.storage
+    app_module.app.config['SHARDS'] = args.shards
+    init_storage(db_path, args.shards)
+    
+    started = time.perf_counter()
+    seed_database(db_path, args.pairs, storage=args.storage, shards=args.shards)
+    size = sum(_database_bytes(path) for path in shard_paths(db_path, args.shards))
+    print(f"Seeded {args.pairs} pairs ({args.storage}, {args.shards} shard(s)) in "
+          f"{time.perf_counter() - started:.1f}s, {size / 1e6:.1f} MB ({workdir})")
+    
+    report = bench_routes(app_module.app, args.flows, args.concurrency)
+    if args.writes:
+        report.update(bench_writes(db_path, args.shards, args.writes, args.write_processes,
+                                   args.storage))
+    report.update(bench_scorer(args.micro_iterations))
+    print_report(report)
+    
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f'{args.save}.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json')) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
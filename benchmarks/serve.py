@@ -0,0 +1,110 @@
+"""
+Sync vs async serving benchmark
+
+Usage:
+    python benchmarks/serve.py [--pairs 2000] [--requests 2000]
+                               [--concurrency 64] [--workers 2]
+
+Seeds a synthetic database, then serves it twice - gunicorn with the
+gunicorn.conf.py preset and uvicorn asgi:application - and drives the share-link routes
+(/partner/<token>, /results/<token>) over real HTTP from many client
+threads. Reports throughput and p50/p95/p99 latency for each server.
+"""
+import argparse
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from run import ROOT, seed_database, summarize
+
+SERVERS = {
+    'gunicorn (sync)': ['gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'app:app',
+                        '--workers', '{workers}', '--bind', '127.0.0.1:{port}'],
+    'uvicorn (asgi)': ['uvicorn', 'asgi:application', '--workers', '{workers}', '--port', '{port}',
+                       '--log-level', 'warning']
+}
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+def _link_tokens(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT link_token FROM pair_links')]
+    finally:
+        conn.close()
+
+def bench_server(command, workdir, paths, concurrency, workers):
+    """Start one server, fetch every path from `concurrency` threads, stop it"""
+    port = _free_port()
+    argv = [part.format(port=port, workers=workers) for part in command]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    server = subprocess.Popen(argv, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        _wait_ready(base + '/')
+        
+        def fetch(path):
+            started = time.perf_counter()
+            with urllib.request.urlopen(base + path, timeout=30) as response:
+                response.read()
+            return time.perf_counter() - started
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = list(pool.map(fetch, paths))
+        return summarize(samples, time.perf_counter() - started)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare sync and async serving')
+    parser.add_argument('--pairs', type=int, default=2000, help='synthetic pairs to seed')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per server')
+    parser.add_argument('--concurrency', type=int, default=64, help='client threads')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    args = parser.parse_args(argv)
+    
+    workdir = tempfile.mkdtemp(prefix='serve-')
+    sys.path.insert(0, ROOT)
+    from utils.db_helper import init_db, close_pools
+    
+    db_path = os.path.join(workdir, 'data', 'compatibility.db')
+    init_db(db_path)
+    seed_database(db_path, args.pairs)
+    close_pools()
+    
+    tokens = _link_tokens(db_path)
+    paths = [random.choice(('/partner/', '/results/')) + random.choice(tokens)
+             for _ in range(args.requests)]
+    
+    print(f"{'server':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, command in SERVERS.items():
+        stats = bench_server(command, workdir, paths, args.concurrency, args.workers)
+        print(f"{name:<18}{stats['ops_per_sec']:>10}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
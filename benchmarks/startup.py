@@ -0,0 +1,63 @@
+"""
+Cold import benchmark for the serving path
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--budget 0.8]
+
+Imports app in fresh interpreters (in a scratch working directory so the
+database is created there), reports the median wall time and exits non-zero
+if it exceeds the budget or if sklearn was pulled in.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'sklearn': 'sklearn' in sys.modules}}))
+'''
+
+def measure(runs):
+    """Import app in `runs` fresh interpreters; returns a list of probe results"""
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            output = subprocess.run([sys.executable, '-c', PROBE.format(root=ROOT)],
+                                    cwd=workdir, capture_output=True, text=True, check=True)
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return samples
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure cold import time of app.py')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=0.8, help='max median seconds')
+    args = parser.parse_args(argv)
+    
+    samples = measure(args.runs)
+    median = statistics.median(s['seconds'] for s in samples)
+    sklearn_loaded = any(s['sklearn'] for s in samples)
+    
+    print(f"import app: median {median * 1000:.0f} ms over {args.runs} runs "
+          f"(budget {args.budget * 1000:.0f} ms)")
+    
+    if sklearn_loaded:
+        print("FAIL: sklearn imported on the serving path")
+        return 1
+    if median > args.budget:
+        print("FAIL: over budget")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
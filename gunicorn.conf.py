@@ -0,0 +1,62 @@
+"""
+Production gunicorn preset
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app). That runs database
+setup, and when_ready() warms the question catalog, the rendered
+questionnaire fragments and the model artifact before any worker exists.
+gc.freeze() then moves everything loaded so far out of the collector's
+reach, so workers share those pages copy-on-write instead of each
+re-reading SQLite and re-importing numpy/scikit-learn. Pooled SQLite
+connections are never shared across the fork: the master closes its own
+before forking, and pools are per-pid, so each worker opens fresh ones.
+
+Workers and threads are sized from the CPUs this process may run on.
+Override with WEB_CONCURRENCY / GUNICORN_THREADS / PORT. Workers are
+recycled after a jittered number of requests to bound memory growth.
+"""
+import gc
+import os
+
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Work is a mix of short SQLite I/O and numpy scoring: one process per core
+# for the CPU part, a few threads each to overlap the I/O waits
+workers = int(os.environ.get('WEB_CONCURRENCY', _available_cpus()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+
+# Recycle workers to bound memory growth; jitter keeps them from all
+# restarting at once
+max_requests = 2000
+max_requests_jitter = 200
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+def when_ready(server):
+    """Warm shared state in the master, then freeze it for copy-on-write sharing"""
+    from app import app, _questionnaire
+    from utils.db_helper import get_catalog, close_pools
+    from utils.ml_model import load_model
+    
+    get_catalog(app.config['DATABASE'])
+    with app.app_context():
+        for gender in (None, 'male', 'female'):
+            _questionnaire(gender)
+    load_model()
+    
+    close_pools()
+    gc.collect()
+    gc.freeze()
+    server.log.info("Preloaded catalog, questionnaire and model in the master")
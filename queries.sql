@@ -32,22 +32,31 @@ FROM responses r
 JOIN questions q ON r.question_id = q.id
 JOIN options o ON r.option_id = o.id
 WHERE r.pair_id = 1  -- Change to specific pair_id
-ORDER BY r.user_number, q.id;
+ORDER BY r.user_number, r.question_id;
 
--- 4. Calculate domain scores for a pair
+-- 4. Calculate domain scores for a pair (from the pair_domain_scores rollup)
 SELECT 
-    r.user_number,
-    q.domain,
-    SUM(o.weight) as domain_score,
-    COUNT(*) as questions_answered
-FROM responses r
-JOIN questions q ON r.question_id = q.id
-JOIN options o ON r.option_id = o.id
-WHERE r.pair_id = 1  -- Change to specific pair_id
-GROUP BY r.user_number, q.domain
-ORDER BY r.user_number, q.domain;
+    user_number,
+    domain,
+    score_sum as domain_score,
+    answer_count as questions_answered
+FROM pair_domain_scores
+WHERE pair_id = 1  -- Change to specific pair_id
+ORDER BY user_number, domain;
+
+-- 5. Compare both users' domain averages side by side
+SELECT 
+    domain,
+    MAX(CASE WHEN user_number = 1 THEN score_sum * 1.0 / answer_count END) as user1_score,
+    MAX(CASE WHEN user_number = 2 THEN score_sum * 1.0 / answer_count END) as user2_score,
+    ABS(MAX(CASE WHEN user_number = 1 THEN score_sum * 1.0 / answer_count END) - 
+        MAX(CASE WHEN user_number = 2 THEN score_sum * 1.0 / answer_count END)) as difference
+FROM pair_domain_scores
+WHERE pair_id = 1  -- Change to specific pair_id
+GROUP BY domain
+ORDER BY difference DESC;
 
--- 5. Compare both users' scores side by side
+-- 5b. Per-question comparison (reads raw responses)
 SELECT 
     q.domain,
     MAX(CASE WHEN r.user_number = 1 THEN o.weight END) as user1_score,
@@ -99,15 +108,14 @@ ORDER BY
 LIMIT 10;
 
 -- 9. Domain-wise average scores across all assessments
-SELECT 
-    q.domain,
-    AVG(o.weight) as avg_score,
-    MIN(o.weight) as min_score,
-    MAX(o.weight) as max_score
-FROM responses r
-JOIN questions q ON r.question_id = q.id
-JOIN options o ON r.option_id = o.id
-GROUP BY q.domain
+-- min/max are over each user's domain average (per-answer extremes need responses)
+SELECT 
+    domain,
+    SUM(score_sum) * 1.0 / SUM(answer_count) as avg_score,
+    MIN(score_sum * 1.0 / answer_count) as min_score,
+    MAX(score_sum * 1.0 / answer_count) as max_score
+FROM pair_domain_scores
+GROUP BY domain
 ORDER BY avg_score DESC;
 
 -- 10. Response time analysis (how long users take)
@@ -122,18 +130,17 @@ GROUP BY pair_id, user_number;
 
 -- 11. Most problematic domains (lowest average scores)
 SELECT 
-    q.domain,
-    AVG(o.weight) as avg_score,
-    COUNT(DISTINCT r.pair_id) as num_couples
-FROM responses r
-JOIN questions q ON r.question_id = q.id
-JOIN options o ON r.option_id = o.id
-GROUP BY q.domain
+    domain,
+    SUM(score_sum) * 1.0 / SUM(answer_count) as avg_score,
+    COUNT(DISTINCT pair_id) as num_couples
+FROM pair_domain_scores
+GROUP BY domain
 HAVING avg_score < 2.5
 ORDER BY avg_score ASC;
 
 -- 12. Delete old incomplete pairs (cleanup)
 -- Uncomment to use - deletes pairs older than 7 days that weren't completed
+-- (python -m utils.compaction does this in batches, including their responses)
 /*
 DELETE FROM pair_links 
 WHERE is_complete = 0 
@@ -54,35 +54,97 @@ function hideLoading() {
     }
 }
 
-// Auto-save functionality for questionnaire
-let autoSaveTimer;
-function autoSave() {
-    clearTimeout(autoSaveTimer);
-    autoSaveTimer = setTimeout(() => {
-        const formData = new FormData(document.querySelector('form'));
-        const data = Object.fromEntries(formData);
-        localStorage.setItem('questionnaire_draft', JSON.stringify(data));
-        console.log('Answers auto-saved');
-    }, 2000);
-}
-
-// Restore saved answers on page load
-window.addEventListener('DOMContentLoaded', () => {
-    const saved = localStorage.getItem('questionnaire_draft');
-    if (saved) {
-        const data = JSON.parse(saved);
-        Object.keys(data).forEach(key => {
-            const input = document.querySelector(`[name="${key}"][value="${data[key]}"]`);
-            if (input) {
-                input.checked = true;
+// Server-side draft of questionnaire answers (see /draft in app.py).
+// Only the questions changed since the last save are sent, debounced,
+// so the final submit has nothing left to upload.
+const DRAFT_DEBOUNCE_MS = 1500;
+const draftForm = document.querySelector('#questionnaire-form, #partner-form');
+
+// Drafts used to live in one localStorage key shared by every form
+localStorage.removeItem('questionnaire_draft');
+
+if (draftForm) {
+    const linkToken = draftForm.elements['link_token'];
+    const draftKey = linkToken ? linkToken.value : 'initiator';
+    // Names the draft until the session remembers it, so a save and a
+    // beacon racing to create it end up in the same one
+    const draftId = Array.from(crypto.getRandomValues(new Uint8Array(16)),
+                               b => b.toString(16).padStart(2, '0')).join('');
+    let pendingAnswers = {};
+    let saving = false;
+    let draftTimer;
+    
+    function draftRequest(answers) {
+        return JSON.stringify({ form: draftKey, draft_id: draftId, answers: answers });
+    }
+    
+    function saveDraft() {
+        clearTimeout(draftTimer);
+        if (saving || Object.keys(pendingAnswers).length === 0) return;
+        
+        const answers = pendingAnswers;
+        pendingAnswers = {};
+        saving = true;
+        fetch('/draft', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            credentials: 'same-origin',
+            body: draftRequest(answers)
+        }).then(response => {
+            if (!response.ok) throw new Error('Draft not saved: ' + response.status);
+        }).catch(error => {
+            // Keep the answers for the next attempt unless they were changed again
+            pendingAnswers = Object.assign(answers, pendingAnswers);
+            console.warn(error);
+        }).finally(() => {
+            saving = false;
+            if (Object.keys(pendingAnswers).length > 0) {
+                draftTimer = setTimeout(saveDraft, DRAFT_DEBOUNCE_MS);
             }
         });
     }
-});
-
-// Clear saved data after successful submission
-function clearAutoSave() {
-    localStorage.removeItem('questionnaire_draft');
+    
+    draftForm.addEventListener('change', (e) => {
+        if (!e.target.name || !e.target.name.startsWith('q_')) return;
+        pendingAnswers[e.target.name] = e.target.value;
+        clearTimeout(draftTimer);
+        draftTimer = setTimeout(saveDraft, DRAFT_DEBOUNCE_MS);
+    });
+    
+    // Whatever is still pending goes along with the submitted form itself
+    draftForm.addEventListener('submit', () => {
+        clearTimeout(draftTimer);
+        pendingAnswers = {};
+    });
+    
+    // Leaving mid-debounce: hand the last changes to the browser to deliver
+    window.addEventListener('pagehide', () => {
+        if (Object.keys(pendingAnswers).length > 0) {
+            navigator.sendBeacon('/draft', new Blob([draftRequest(pendingAnswers)],
+                                                    { type: 'application/json' }));
+            pendingAnswers = {};
+        }
+    });
+    
+    // Restore saved answers this session already gave for this form
+    fetch('/draft?form=' + encodeURIComponent(draftKey), { credentials: 'same-origin' })
+        .then(response => response.ok ? response.json() : { answers: {} })
+        .then(data => {
+            let restored = 0;
+            Object.keys(data.answers).forEach(key => {
+                if (draftForm.querySelector(`[name="${key}"]:checked`)) return;
+                const input = draftForm.querySelector(`[name="${key}"][value="${data.answers[key]}"]`);
+                if (input) {
+                    input.checked = true;
+                    restored++;
+                }
+            });
+            if (restored > 0) {
+                // Let the page update its progress bar
+                draftForm.dispatchEvent(new Event('change'));
+            }
+        })
+        .catch(error => console.warn(error));
 }
 
 // Add animations on scroll
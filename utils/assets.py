@@ -0,0 +1,193 @@
+"""
+Build fingerprinted, minified and precompressed static assets
+
+Usage:
+    python -m utils.assets [--static static]
+
+Each file in ASSETS is minified and written to static/dist under a name
+carrying a hash of its content (css/style.3f2a9c1b0d.css), next to gzip
+and (when the optional brotli package is installed) brotli variants.
+dist/manifest.json maps source names to built names. Templates link
+assets with asset_url('css/style.css'), which emits the built name when
+the manifest has one and the plain /static URL otherwise, so the app
+still works before the first build. Built files are served from /assets
+with immutable cache headers: a changed file gets a new name, so browsers
+never need to revalidate. Files from earlier builds are left in place
+(and still served) for pages that still reference them. A running app
+picks up a new build's manifest on its own; no restart is needed.
+
+Minification is deliberately conservative: comments and layout
+whitespace are removed, nothing is renamed or rewritten.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Source files (relative to the static folder) that get built
+ASSETS = ('css/style.css', 'js/script.js')
+
+# Build output directory and manifest, relative to the static folder
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Precompressed variants, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+# One year; built names change whenever their content does
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)''',
+                         re.DOTALL)
+
+def minify_css(source):
+    """Drop comments and collapse whitespace, leaving strings untouched"""
+    def replace(match):
+        string, comment, space = match.groups()
+        if string:
+            return string
+        return '' if comment else ' '
+    css = _CSS_TOKENS.sub(replace, source)
+    
+    # Whitespace around punctuation outside strings; a space before ':'
+    # is kept, since it matters in selectors ("a :hover")
+    parts = re.split(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''', css)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r'\s*([{};,])\s*', r'\1', parts[i])
+        part = re.sub(r':\s+', ':', part)
+        parts[i] = part.replace(';}', '}')
+    return ''.join(parts).strip()
+
+def minify_js(source):
+    """Strip indentation, blank lines and whole-line // comments (template literals kept)"""
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        # Backticks not escaped with a backslash open or close a template literal
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def _write(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build_asset(static_folder, name):
+    """Minify, fingerprint and compress one asset; returns (built name, sizes)"""
+    root, ext = os.path.splitext(name)
+    with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+        source = f.read()
+    minify = MINIFIERS.get(ext)
+    body = (minify(source) if minify else source).encode('utf-8')
+    
+    built = f'{root}.{hashlib.sha256(body).hexdigest()[:10]}{ext}'
+    path = os.path.join(static_folder, DIST_DIR, built)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    variants = {'identity': body,
+                'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli:
+        variants['br'] = brotli.compress(body, quality=11)
+    
+    _write(path, body)
+    for encoding, suffix in ENCODINGS.items():
+        if encoding in variants:
+            _write(path + suffix, variants[encoding])
+    sizes = {'source': len(source.encode('utf-8'))}
+    sizes.update((encoding, len(data)) for encoding, data in variants.items())
+    return built, sizes
+
+def build(static_folder, names=ASSETS):
+    """Build every asset and write the manifest; returns {name: (built name, sizes)}"""
+    report = {name: build_asset(static_folder, name) for name in names}
+    manifest = {name: built for name, (built, _) in report.items()}
+    _write(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return report
+
+def load_manifest(static_folder):
+    """Source name -> built name from the last build ({} if never built)"""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def current_manifest(static_folder):
+    """
+    load_manifest(), reread whenever a build replaces the manifest file
+    
+    Returns (manifest, reloaded); reloaded is True on the call that picked
+    up a different manifest than the last one (including the first call).
+    """
+    try:
+        mtime = os.stat(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    cached = _manifests.get(static_folder)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], False
+    with _manifests_lock:
+        cached = _manifests.get(static_folder)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], False
+        manifest = load_manifest(static_folder)
+        _manifests[static_folder] = (mtime, manifest)
+        return manifest, True
+
+def is_built(static_folder, name):
+    """True if name is an asset some build wrote to dist (not a variant or the manifest)"""
+    if name == MANIFEST_NAME or name.endswith(tuple(ENCODINGS.values()) + ('.tmp',)):
+        return False
+    return os.path.isfile(os.path.join(static_folder, DIST_DIR, name))
+
+def precompressed(static_folder, built_name, accept_encoding):
+    """
+    Best file to send for a built asset and its Content-Encoding
+    
+    accept_encoding is the request's parsed Accept-Encoding; returns
+    (file name relative to dist, encoding or None). The plain file is sent
+    when the client prefers identity, or accepts none of the variants.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    available = [encoding for encoding, suffix in ENCODINGS.items()
+                 if os.path.exists(os.path.join(dist, built_name + suffix))]
+    # Listed last, so a compressed variant wins a tie
+    encoding = accept_encoding.best_match(available + ['identity']) if available else None
+    if encoding in ENCODINGS:
+        return built_name + ENCODINGS[encoding], encoding
+    return built_name, None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build fingerprinted static assets')
+    parser.add_argument('--static', default='static', help='static folder')
+    args = parser.parse_args(argv)
+    
+    for name, (built, sizes) in build(args.static).items():
+        compressed = ', '.join(f"{encoding} {sizes[encoding]}" for encoding in ENCODINGS
+                               if encoding in sizes)
+        print(f"{name} -> {DIST_DIR}/{built}: {sizes['source']} bytes, "
+              f"minified {sizes['identity']}, {compressed}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Async wrappers over the blocking db_helper/result_store functions
+
+SQLite calls run on a bounded thread pool so the event loop never blocks on
+database I/O. A semaphore of the same size makes excess callers wait in the
+loop (holding no thread) instead of piling up in the executor queue.
+Calls run in a copy of the caller's context, so context variables such as
+the metrics route label carry over to the worker thread.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import db_helper, result_store
+
+# Threads available for blocking work per process
+EXECUTOR_THREADS = 16
+
+_executor = None
+_semaphore = None
+
+def _get_executor():
+    global _executor, _semaphore
+    if _executor is None:
+        _executor = ThreadPoolExecutor(EXECUTOR_THREADS, thread_name_prefix='async-db')
+        _semaphore = asyncio.Semaphore(EXECUTOR_THREADS)
+    return _executor
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking callable on the bounded executor"""
+    executor = _get_executor()
+    context = contextvars.copy_context()
+    async with _semaphore:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, functools.partial(context.run, fn, *args, **kwargs)
+        )
+
+def shutdown():
+    """Stop the executor (waits for running calls)"""
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = _semaphore = None
+
+async def get_pair_link(db_path, link_token):
+    return await run(db_helper.get_pair_link, db_path, link_token)
+
+async def get_catalog(db_path):
+    return await run(db_helper.get_catalog, db_path)
+
+async def get_result(db_path, link_token):
+    return await run(result_store.get_result, db_path, link_token)
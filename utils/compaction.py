@@ -0,0 +1,241 @@
+"""
+Expire abandoned share links and compact the tables they occupy
+
+Usage:
+    python -m utils.compaction [--db data/compatibility.db] [--ttl-days 7]
+                               [--batch-size 500] [--archive data/archive.db]
+                               [--full-vacuum] [--every SECONDS]
+
+A pair whose partner never answered expires LINK_TTL_DAYS after it was
+created; the partner page refuses expired links. compact() removes expired
+incomplete pairs and everything hanging off them (responses, packed
+answers, rollups, results) in short batches, copying them to an archive
+database first when one is given, then runs an incremental vacuum and
+reports how much space was given back. Questionnaire drafts nobody has
+saved for drafts.DRAFT_TTL_SECONDS are purged in the same run; drafts
+live in the primary database, so with SHARDS > 1 compact it as well as
+the shards (the background thread covers storage.database_paths()).
+
+Incremental vacuum needs auto_vacuum = INCREMENTAL. New databases get it
+from init_db; an older file is converted once with --full-vacuum (a full
+VACUUM that locks the database while it runs).
+
+The app can run compaction in a background thread (COMPACTION_INTERVAL
+in app.config); a lock file makes sure only one process compacts at a
+time.
+"""
+import argparse
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from utils import drafts
+from utils.db_helper import BUSY_TIMEOUT_MS
+
+# Default lifetime of a share link that was never answered
+LINK_TTL_DAYS = 7
+
+# Expired pairs removed per transaction
+BATCH_SIZE = 500
+
+# Tables keyed by pair_id, cleared before the pair_links row itself
+PAIR_TABLES = ('responses', 'packed_responses', 'pair_domain_scores', 'results', 'pair_outcomes')
+
+logger = logging.getLogger(__name__)
+
+_compactor = None
+_compactor_pid = None
+_compactor_lock = threading.Lock()
+
+def expiry_cutoff(ttl_days, now=None):
+    """created_at value (ISO string) below which a link has expired"""
+    return ((now or datetime.now()) - timedelta(days=ttl_days)).isoformat()
+
+def is_expired(created_at, ttl_days):
+    """True if a link created at created_at is past its TTL (None = never expires)"""
+    return ttl_days is not None and created_at < expiry_cutoff(ttl_days)
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute('PRAGMA journal_mode = WAL').fetchone()
+    return conn
+
+def _database_bytes(conn):
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    return conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+
+def _columns(conn, schema, table):
+    """(name, declared type) of each column of schema.table"""
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+def _prepare_archive(conn, archive_path):
+    """
+    Attach the archive and bring its tables up to the live schema
+    
+    Returns {table: column names}; rows are copied by name, so an archive
+    created before a migration added a column keeps working once that
+    column has been added to it too.
+    """
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+    columns = {}
+    for table in PAIR_TABLES + ('pair_links',):
+        conn.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} AS '
+                     f'SELECT * FROM main.{table} WHERE 0')
+        archived = {name for name, _ in _columns(conn, 'archive', table)}
+        live = _columns(conn, 'main', table)
+        for name, declared_type in live:
+            if name not in archived:
+                conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN "{name}" {declared_type}')
+        columns[table] = [name for name, _ in live]
+    conn.commit()
+    return columns
+
+def _delete_batch(conn, cutoff, batch_size, archive_columns):
+    """
+    Remove one batch of expired pairs; returns (pairs, rows deleted per table)
+    
+    archive_columns is what _prepare_archive returned, or None to delete
+    without archiving.
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            SELECT id FROM pair_links
+            WHERE is_complete = 0 AND created_at < ?
+            ORDER BY created_at
+            LIMIT ?
+        ''', (cutoff, batch_size))
+        pair_ids = [row[0] for row in cursor.fetchall()]
+        deleted = {}
+        if pair_ids:
+            placeholders = ','.join('?' * len(pair_ids))
+            for table, column in [(t, 'pair_id') for t in PAIR_TABLES] + [('pair_links', 'id')]:
+                where = f'{column} IN ({placeholders})'
+                if archive_columns:
+                    names = ', '.join(f'"{name}"' for name in archive_columns[table])
+                    cursor.execute(f'INSERT INTO archive.{table} ({names}) '
+                                   f'SELECT {names} FROM main.{table} WHERE {where}', pair_ids)
+                cursor.execute(f'DELETE FROM main.{table} WHERE {where}', pair_ids)
+                deleted[table] = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(pair_ids), deleted
+
+def compact(db_path, ttl_days=LINK_TTL_DAYS, batch_size=BATCH_SIZE, archive_path=None,
+            full_vacuum=False):
+    """
+    Delete (or archive) expired incomplete pairs, then reclaim free pages
+    
+    Returns a report dict: pairs removed, rows per table, bytes reclaimed
+    and the auto_vacuum mode the database is in.
+    """
+    conn = _connect(db_path)
+    try:
+        size_before = _database_bytes(conn)
+        archive_columns = _prepare_archive(conn, archive_path) if archive_path else None
+    
+        cutoff = expiry_cutoff(ttl_days)
+        pairs = 0
+        rows = {}
+        while True:
+            removed, deleted = _delete_batch(conn, cutoff, batch_size, archive_columns)
+            pairs += removed
+            for table, count in deleted.items():
+                rows[table] = rows.get(table, 0) + count
+            if removed < batch_size:
+                break
+        purged_drafts = drafts.purge_expired(conn)
+    
+        if full_vacuum:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if auto_vacuum == 2:
+            # execute() steps a pragma only once (one page); executescript
+            # runs it to completion
+            conn.executescript('PRAGMA incremental_vacuum;')
+        # Fold the vacuum into the main file so the file really shrinks
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    
+        return {
+            'pairs': pairs,
+            'rows': rows,
+            'drafts': purged_drafts,
+            'bytes_reclaimed': size_before - _database_bytes(conn),
+            'free_pages': conn.execute('PRAGMA freelist_count').fetchone()[0],
+            'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}[auto_vacuum]
+        }
+    finally:
+        conn.close()
+
+def _compact_exclusive(db_path, ttl_days):
+    """Compact unless another process is already doing it"""
+    with open(db_path + '.compaction.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        return compact(db_path, ttl_days)
+
+def _compaction_loop(db_paths, ttl_days, interval, stop):
+    while not stop.wait(interval):
+        for db_path in db_paths:
+            try:
+                report = _compact_exclusive(db_path, ttl_days)
+                if report and report['pairs']:
+                    logger.info("Compaction of %s removed %d expired pairs, reclaimed %d bytes",
+                                db_path, report['pairs'], report['bytes_reclaimed'])
+            except Exception:
+                logger.exception("Compaction of %s failed", db_path)
+
+def ensure_compactor(db_paths, ttl_days, interval):
+    """Start the background compaction thread for this process (once per pid)"""
+    global _compactor, _compactor_pid
+    if _compactor_pid == os.getpid():
+        return
+    with _compactor_lock:
+        # Threads don't survive a fork; each worker starts its own
+        if _compactor_pid == os.getpid():
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_compaction_loop,
+                                  args=(list(db_paths), ttl_days, interval, stop),
+                                  name='compaction', daemon=True)
+        thread.start()
+        _compactor = (thread, stop)
+        _compactor_pid = os.getpid()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Expire abandoned links and compact the database')
+    parser.add_argument('--db', default='data/compatibility.db', help='SQLite database path')
+    parser.add_argument('--ttl-days', type=float, default=LINK_TTL_DAYS,
+                        help='age after which unanswered links expire')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='pairs per transaction')
+    parser.add_argument('--archive', help='copy expired pairs into this SQLite file first')
+    parser.add_argument('--full-vacuum', action='store_true',
+                        help='convert to incremental auto_vacuum with a full VACUUM')
+    parser.add_argument('--every', type=float, metavar='SECONDS',
+                        help='keep running, compacting at this interval')
+    args = parser.parse_args(argv)
+    
+    while True:
+        started = time.perf_counter()
+        report = compact(args.db, args.ttl_days, args.batch_size, args.archive, args.full_vacuum)
+        print(f"Removed {report['pairs']} expired pairs {report['rows']} and "
+              f"{report['drafts']} stale drafts, reclaimed "
+              f"{report['bytes_reclaimed'] / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s "
+              f"(auto_vacuum {report['auto_vacuum']}, {report['free_pages']} free pages)")
+        if args.every is None:
+            return
+        args.full_vacuum = False
+        time.sleep(args.every)
+
+if __name__ == '__main__':
+    main()
@@ -1,79 +1,218 @@
 import sqlite3
 import os
+import threading
+import time
+
+from utils import metrics
+from utils.migrations import migrate
+
+# Seconds between catalog version checks; the hot path never touches SQLite
+CATALOG_RECHECK_SECONDS = 30
+
+# Per-process connection pool settings
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 8192
+MMAP_SIZE = 256 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 256
+
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records every statement in the SQL timing histogram"""
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_sql(sql, time.perf_counter() - started)
+    
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_sql(sql, time.perf_counter() - started)
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool"""
+    pool = None
+    idle = False
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def close(self):
+        if self.idle:
+            return
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+class ConnectionPool:
+    """
+    Thread-safe pool of tuned SQLite connections for one database file
+    
+    Connections run in WAL mode with a busy timeout, a larger page cache,
+    memory-mapped I/O and a prepared-statement cache. Read-only pools open
+    the file with mode=ro and query_only so GET routes can never write.
+    """
+    
+    def __init__(self, db_path, read_only=False, size=POOL_SIZE):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.in_use = 0
+    
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True,
+                                   factory=PooledConnection, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.db_path, factory=PooledConnection,
+                                   check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        if not self.read_only:
+            conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        if self.read_only:
+            conn.execute('PRAGMA query_only = 1')
+        conn.pool = self
+        return conn
+    
+    def acquire(self):
+        """Take an idle connection or open a new one"""
+        with self._lock:
+            self.in_use += 1
+            if self._idle:
+                conn = self._idle.pop()
+                conn.idle = False
+                self.reused += 1
+                return conn
+            self.created += 1
+        try:
+            conn = self._connect()
+        except Exception:
+            # The slot was never filled; give it back
+            with self._lock:
+                self.in_use -= 1
+                self.created -= 1
+            raise
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def release(self, conn):
+        """Return a connection; False means the caller should really close it"""
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) >= self.size:
+                self.discarded += 1
+                return False
+            conn.idle = True
+            self._idle.append(conn)
+            return True
+    
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.pool = None
+            conn.idle = False
+            conn.close()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded
+            }
+
+def _get_pool(db_path, read_only):
+    global _pools_pid
+    with _pools_lock:
+        # Connections must not cross a fork; children start with fresh pools
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        key = (db_path, read_only)
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path, read_only)
+        return pool
 
 def get_db_connection(db_path):
-    """Create database connection with row factory"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get a pooled read-write connection with row factory; close() returns it to the pool"""
+    with metrics.timed('app_db_connect_seconds', mode='rw'):
+        return _get_pool(db_path, False).acquire()
+
+def get_read_connection(db_path):
+    """Get a pooled read-only connection with row factory"""
+    with metrics.timed('app_db_connect_seconds', mode='ro'):
+        return _get_pool(db_path, True).acquire()
+
+def pool_stats():
+    """Connection pool counters keyed by 'path' or 'path (ro)'"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {
+        pool.db_path + (' (ro)' if pool.read_only else ''): pool.stats()
+        for pool in pools
+    }
+
+def close_pools():
+    """Close all pooled connections in this process"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
 
 def init_db(db_path):
     """Initialize database with schema and sample data"""
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn.row_factory = sqlite3.Row
     
-    # Create tables
-    cursor.executescript('''
-        -- Table: pair_links (stores generated links for couples)
-        CREATE TABLE IF NOT EXISTS pair_links (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            link_token TEXT UNIQUE NOT NULL,
-            relationship_status TEXT NOT NULL,  -- 'married' or 'unmarried'
-            created_at TEXT NOT NULL,
-            is_complete INTEGER DEFAULT 0,
-            CONSTRAINT chk_status CHECK (relationship_status IN ('married', 'unmarried'))
-        );
-        
-        -- Table: questions (all questionnaire questions)
-        CREATE TABLE IF NOT EXISTS questions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_text TEXT NOT NULL,
-            domain TEXT NOT NULL,  -- e.g., 'communication', 'finance', 'intimacy'
-            gender_specific TEXT DEFAULT 'both',  -- 'male', 'female', or 'both'
-            CONSTRAINT chk_gender CHECK (gender_specific IN ('male', 'female', 'both'))
-        );
-        
-        -- Table: options (answer options for each question with weights)
-        CREATE TABLE IF NOT EXISTS options (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_id INTEGER NOT NULL,
-            option_text TEXT NOT NULL,
-            weight INTEGER NOT NULL,  -- numeric weight for ML model
-            FOREIGN KEY (question_id) REFERENCES questions(id)
-        );
-        
-        -- Table: responses (stores user answers)
-        CREATE TABLE IF NOT EXISTS responses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            pair_id INTEGER NOT NULL,
-            user_number INTEGER NOT NULL,  -- 1 or 2
-            question_id INTEGER NOT NULL,
-            option_id INTEGER NOT NULL,
-            response_time TEXT NOT NULL,
-            FOREIGN KEY (pair_id) REFERENCES pair_links(id),
-            FOREIGN KEY (question_id) REFERENCES questions(id),
-            FOREIGN KEY (option_id) REFERENCES options(id),
-            CONSTRAINT chk_user CHECK (user_number IN (1, 2))
-        );
-        
-        -- Table: results (stores prediction results)
-        CREATE TABLE IF NOT EXISTS results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            pair_id INTEGER NOT NULL,
-            prediction_label TEXT NOT NULL,  -- e.g., 'High Compatibility', 'Divorce Risk'
-            probability_score REAL NOT NULL,
-            explanation TEXT,
-            predicted_at TEXT NOT NULL,
-            FOREIGN KEY (pair_id) REFERENCES pair_links(id)
-        );
-        
-        -- Indexes for performance
-        CREATE INDEX IF NOT EXISTS idx_link_token ON pair_links(link_token);
-        CREATE INDEX IF NOT EXISTS idx_responses_pair ON responses(pair_id);
-        CREATE INDEX IF NOT EXISTS idx_options_question ON options(question_id);
-    ''')
+    # Lets compaction hand freed pages back to the OS (only takes effect on
+    # a new file; utils/compaction.py --full-vacuum converts older ones)
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
+    # WAL lets readers proceed while a worker holds the write lock
+    conn.execute('PRAGMA journal_mode = WAL').fetchone()
+    
+    # Create or upgrade the schema (utils/migrations.py)
+    migrate(conn)
+    
+    cursor = conn.cursor()
     
     # Insert sample questions if not exists
     cursor.execute('SELECT COUNT(*) as cnt FROM questions')
@@ -84,6 +223,55 @@ def init_db(db_path):
     conn.close()
     print(f"Database initialized at {db_path}")
 
+def rebuild_domain_scores(cursor, pair_id=None):
+    """Recompute pair_domain_scores from responses for one pair, or all pairs"""
+    if pair_id is None:
+        cursor.execute('DELETE FROM pair_domain_scores')
+        where, params = '', ()
+    else:
+        cursor.execute('DELETE FROM pair_domain_scores WHERE pair_id = ?', (pair_id,))
+        where, params = 'WHERE r.pair_id = ?', (pair_id,)
+    
+    cursor.execute(f'''
+        INSERT INTO pair_domain_scores (pair_id, user_number, domain, score_sum, answer_count)
+        SELECT r.pair_id, r.user_number, q.domain, SUM(o.weight), COUNT(*)
+        FROM responses r
+        JOIN questions q ON r.question_id = q.id
+        JOIN options o ON r.option_id = o.id
+        {where}
+        GROUP BY r.pair_id, r.user_number, q.domain
+    ''', params)
+    
+    # Packed storage only exists from schema version 6 on
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'packed_responses'")
+    if cursor.fetchone() is None:
+        return
+    cursor.execute('SELECT 1 FROM packed_responses LIMIT 1')
+    if cursor.fetchone() is not None:
+        from utils.packed_storage import add_domain_scores
+        add_domain_scores(cursor, _load_catalog(cursor.connection, None), pair_id)
+
+def update_option_weights(db_path, weights):
+    """
+    Change option weights ({option_id: weight}) and rebuild the rollups
+    
+    Both happen in one transaction, so results never pair new weights with
+    old rollups. Hand edits to options.weight need rebuild_domain_scores
+    afterwards; shards rebuild theirs when storage.sync_catalogs copies a
+    reweighted catalog over.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.executemany('UPDATE options SET weight = ? WHERE id = ?',
+                           [(weight, option_id) for option_id, weight in weights.items()])
+        rebuild_domain_scores(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate_catalog(db_path)
+
 def insert_sample_questions(cursor):
     """Insert sample questionnaire questions and options"""
     
@@ -329,18 +517,12 @@ def insert_sample_questions(cursor):
         ''', (question_id, option_text, weight))
 
 def save_response(db_path, pair_id, user_number, question_id, option_id, response_time):
-    """Save a single response"""
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO responses (pair_id, user_number, question_id, option_id, response_time)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (pair_id, user_number, question_id, option_id, response_time))
-    conn.commit()
-    conn.close()
+    """Save a single response (use response_writer.save_responses for batches)"""
+    from utils.response_writer import save_responses
+    save_responses(db_path, pair_id, user_number, [(question_id, option_id)], response_time)
 
 def get_responses_by_link(db_path, link_token):
-    """Get all responses for a pair by link token"""
+    """Get all responses for a pair by link token (row and packed storage)"""
     conn = get_db_connection(db_path)
     cursor = conn.cursor()
     cursor.execute('''
@@ -352,5 +534,125 @@ def get_responses_by_link(db_path, link_token):
         WHERE pl.link_token = ?
     ''', (link_token,))
     responses = cursor.fetchall()
+    
+    cursor.execute('''
+        SELECT p.pair_id FROM packed_responses p
+        JOIN pair_links pl ON p.pair_id = pl.id
+        WHERE pl.link_token = ?
+        LIMIT 1
+    ''', (link_token,))
+    packed = cursor.fetchone()
+    if packed is not None:
+        from utils.packed_storage import packed_rows
+        responses += packed_rows(cursor, get_catalog(db_path), packed['pair_id'])
     conn.close()
     return responses
+
+def get_pair_link(db_path, link_token):
+    """Pair link row (id, relationship_status, created_at, is_complete) for a token, or None"""
+    conn = get_read_connection(db_path)
+    try:
+        return conn.execute('''
+            SELECT id, relationship_status, created_at, is_complete 
+            FROM pair_links 
+            WHERE link_token = ?
+        ''', (link_token,)).fetchone()
+    finally:
+        conn.close()
+
+def _load_catalog(conn, version):
+    """Load all questions and options with a single join"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT q.id AS question_id, q.question_text, q.domain, q.gender_specific,
+               o.id AS option_id, o.option_text, o.weight
+        FROM questions q
+        LEFT JOIN options o ON o.question_id = q.id
+        ORDER BY q.id, o.id
+    ''')
+    
+    questions = []
+    options = {}
+    current = None
+    for row in cursor.fetchall():
+        if current is None or current['id'] != row['question_id']:
+            current = {
+                'id': row['question_id'],
+                'text': row['question_text'],
+                'domain': row['domain'],
+                'gender_specific': row['gender_specific'],
+                'options': []
+            }
+            questions.append(current)
+        if row['option_id'] is not None:
+            option = {
+                'id': row['option_id'],
+                'option_text': row['option_text'],
+                'weight': row['weight']
+            }
+            current['options'].append(option)
+            options[row['option_id']] = {
+                'question_id': row['question_id'],
+                'domain': row['domain'],
+                'weight': row['weight']
+            }
+    
+    by_gender = {
+        gender: [q for q in questions if q['gender_specific'] in ('both', gender)]
+        for gender in ('male', 'female', 'both')
+    }
+    
+    return {
+        'version': version,
+        'questions': questions,
+        'by_gender': by_gender,
+        'options': options,
+        'checked_at': time.monotonic()
+    }
+
+def _catalog_version(conn):
+    row = conn.execute('SELECT version FROM catalog_meta WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+def get_catalog(db_path):
+    """
+    Return the cached questionnaire catalog for db_path
+    
+    The catalog is reloaded only when the catalog_meta version (bumped by
+    triggers on questions/options) has changed since the last check.
+    """
+    catalog = _catalog_cache.get(db_path)
+    if catalog and time.monotonic() - catalog['checked_at'] < CATALOG_RECHECK_SECONDS:
+        return catalog
+    
+    with _catalog_lock:
+        catalog = _catalog_cache.get(db_path)
+        if catalog and time.monotonic() - catalog['checked_at'] < CATALOG_RECHECK_SECONDS:
+            return catalog
+        
+        conn = get_read_connection(db_path)
+        try:
+            version = _catalog_version(conn)
+            if catalog and catalog['version'] == version:
+                catalog['checked_at'] = time.monotonic()
+            else:
+                catalog = _load_catalog(conn, version)
+                _catalog_cache[db_path] = catalog
+        finally:
+            conn.close()
+        return catalog
+
+def get_catalog_questions(db_path, gender=None):
+    """Questions with options for a gender ('male'/'female'/'both'), or all when None"""
+    catalog = get_catalog(db_path)
+    if gender is None:
+        return catalog['questions']
+    return catalog['by_gender'].get(gender, catalog['by_gender']['both'])
+
+def invalidate_catalog(db_path=None):
+    """Drop cached catalogs so the next read reloads from SQLite"""
+    with _catalog_lock:
+        if db_path is None:
+            _catalog_cache.clear()
+        else:
+            _catalog_cache.pop(db_path, None)
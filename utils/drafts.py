@@ -0,0 +1,157 @@
+"""
+Server-side drafts of half-filled questionnaires
+
+The questionnaire pages save answers as the user goes: the browser posts
+only the questions that changed since its last save (debounced) to /draft,
+and each save is a small UPSERT into draft_answers. At final submit the
+saved answers are merged under whatever the form posts, so the submit is
+only the commit step. Drafts are keyed by form (INITIATOR_FORM or the
+partner's link token) in the user's own session, so they don't leak
+between people sharing a browser profile or between the two forms. The
+page names a new draft itself, so two first saves racing each other
+(a fetch and a sendBeacon) upsert one draft rather than creating two.
+
+SQLite (the drafts and draft_answers tables in the primary database) is
+the source of truth. Each process keeps recently used drafts in memory;
+the session cookie carries the draft's revision, so a cached copy is only
+used when it is current, even if another worker saved the last change.
+Drafts untouched for DRAFT_TTL_SECONDS are ignored and removed by
+purge_expired() (run from utils.compaction).
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from utils.db_helper import get_db_connection
+
+# Drafts not saved for this long are dropped
+DRAFT_TTL_SECONDS = 2 * 24 * 3600
+
+# Drafts kept in memory per process (least recently used evicted)
+MAX_CACHED_DRAFTS = 10000
+
+# Form key of the first partner's questionnaire; the partner form uses its link token
+INITIATOR_FORM = 'initiator'
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+def new_draft_id():
+    return secrets.token_urlsafe(16)
+
+def _cutoff(ttl_seconds):
+    return (datetime.now() - timedelta(seconds=ttl_seconds)).isoformat()
+
+def _cache_get(draft_id, revision):
+    with _lock:
+        entry = _cache.get(draft_id)
+        if entry is None or entry[0] != revision or entry[2] < time.monotonic():
+            return None
+        _cache.move_to_end(draft_id)
+        return dict(entry[1])
+
+def _cache_put(draft_id, revision, answers):
+    with _lock:
+        _cache[draft_id] = (revision, dict(answers), time.monotonic() + DRAFT_TTL_SECONDS)
+        _cache.move_to_end(draft_id)
+        while len(_cache) > MAX_CACHED_DRAFTS:
+            _cache.popitem(last=False)
+
+def _cache_drop(draft_id):
+    with _lock:
+        _cache.pop(draft_id, None)
+
+def save(db_path, draft_id, form, delta):
+    """
+    Store changed answers ({question_id: option_id}) for a draft
+    
+    Creates the draft on its first save. Returns the new revision, or None
+    if draft_id belongs to a different form.
+    """
+    now = datetime.now().isoformat()
+    conn = get_db_connection(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            INSERT INTO drafts (id, form, revision, updated_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT (id) DO UPDATE
+            SET revision = revision + 1, updated_at = excluded.updated_at
+            WHERE form = excluded.form
+            RETURNING revision
+        ''', (draft_id, form, now))
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        revision = row[0]
+        cursor.executemany('''
+            INSERT INTO draft_answers (draft_id, question_id, option_id) VALUES (?, ?, ?)
+            ON CONFLICT (draft_id, question_id) DO UPDATE SET option_id = excluded.option_id
+        ''', [(draft_id, question_id, option_id) for question_id, option_id in delta.items()])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    # Patch the cached copy only if it was the revision this save built on
+    cached = _cache_get(draft_id, revision - 1)
+    if cached is not None:
+        cached.update(delta)
+        _cache_put(draft_id, revision, cached)
+    else:
+        _cache_drop(draft_id)
+    return revision
+
+def load(db_path, draft_id, revision):
+    """Saved answers of a draft as {question_id: option_id}, or None if gone or expired"""
+    answers = _cache_get(draft_id, revision)
+    if answers is not None:
+        return answers
+    
+    conn = get_db_connection(db_path)
+    try:
+        row = conn.execute('SELECT revision, updated_at FROM drafts WHERE id = ?',
+                           (draft_id,)).fetchone()
+        if row is None or row['updated_at'] < _cutoff(DRAFT_TTL_SECONDS):
+            return None
+        answers = dict(conn.execute('''
+            SELECT question_id, option_id FROM draft_answers WHERE draft_id = ?
+        ''', (draft_id,)).fetchall())
+    finally:
+        conn.close()
+    _cache_put(draft_id, row['revision'], answers)
+    return answers
+
+def discard(db_path, draft_id):
+    """Delete a draft once its answers have been submitted"""
+    _cache_drop(draft_id)
+    conn = get_db_connection(db_path)
+    try:
+        conn.execute('DELETE FROM draft_answers WHERE draft_id = ?', (draft_id,))
+        conn.execute('DELETE FROM drafts WHERE id = ?', (draft_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def purge_expired(conn, ttl_seconds=DRAFT_TTL_SECONDS):
+    """Delete drafts not saved within ttl_seconds (caller's connection); returns the count"""
+    cutoff = _cutoff(ttl_seconds)
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            DELETE FROM draft_answers
+            WHERE draft_id IN (SELECT id FROM drafts WHERE updated_at < ?)
+        ''', (cutoff,))
+        cursor.execute('DELETE FROM drafts WHERE updated_at < ?', (cutoff,))
+        purged = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return purged
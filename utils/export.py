@@ -0,0 +1,111 @@
+"""
+Export pairs, domain features and results for offline analysis
+
+Usage:
+    python -m utils.export [--db data/compatibility.db] [--shards 1] [--out exports]
+                           [--format csv|parquet] [--chunk-size 50000]
+                           [--completed-only]
+
+Each shard (utils/storage.py; just --db when unsharded) is read on a
+read-only connection inside a single read transaction, so every chunk of
+it comes from the same WAL snapshot while the app keeps writing. Pairs
+are read in pair_id order, one keyset-paginated chunk at a time, and each
+chunk is written to its own part file (part-00000.csv, ...). Memory use
+is bounded by the chunk size, not by the size of the database. Each row
+has the pair's shard and pair_id (pair_id alone repeats across shards),
+its status, its latest result and the wide feature columns of
+create_features (FEATURE_NAMES). Link tokens are not exported, because
+they grant access to the results page.
+
+Parquet output needs pyarrow (or fastparquet) installed next to pandas.
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from utils.db_helper import get_read_connection
+from utils.ml_model import FEATURE_NAMES, create_features_batch, scores_to_matrix_batch
+from utils.result_store import load_domain_scores
+from utils.storage import shard_paths
+
+PAIR_COLUMNS = ['shard', 'pair_id', 'relationship_status', 'created_at', 'is_complete',
+                'prediction_label', 'probability_score', 'model_version', 'predicted_at']
+
+def iter_export_chunks(conn, chunk_size, completed_only=False, shard=0):
+    """Yield one DataFrame per chunk of one shard's pairs, in pair_id order"""
+    cursor = conn.cursor()
+    completed = 'AND pl.is_complete = 1' if completed_only else ''
+    last_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT pl.id AS pair_id, pl.relationship_status, pl.created_at, pl.is_complete,
+                   r.prediction_label, r.probability_score, r.model_version, r.predicted_at
+            FROM pair_links pl
+            LEFT JOIN results r ON r.pair_id = pl.id
+            WHERE pl.id > ? {completed}
+            ORDER BY pl.id
+            LIMIT ?
+        ''', (last_id, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        pair_ids = [row['pair_id'] for row in rows]
+        user1_scores, user2_scores = load_domain_scores(cursor, pair_ids)
+        scores = scores_to_matrix_batch(user1_scores, user2_scores)
+
+        chunk = pd.DataFrame([(shard,) + tuple(row) for row in rows], columns=PAIR_COLUMNS)
+        features = pd.DataFrame(create_features_batch(scores), columns=FEATURE_NAMES)
+        yield pd.concat([chunk, features], axis=1)
+        last_id = pair_ids[-1]
+
+def write_part(frame, out_dir, part, file_format):
+    """Write one part file atomically; returns its path"""
+    path = os.path.join(out_dir, f'part-{part:05d}.{file_format}')
+    tmp_path = path + '.tmp'
+    if file_format == 'parquet':
+        frame.to_parquet(tmp_path, index=False)
+    else:
+        frame.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+def export(db_path, out_dir, file_format='csv', chunk_size=50000, completed_only=False,
+           shards=1):
+    """Export every pair of every shard, each shard from one snapshot; returns (rows, files)"""
+    os.makedirs(out_dir, exist_ok=True)
+    rows = files = 0
+    for shard, path in enumerate(shard_paths(db_path, shards)):
+        conn = get_read_connection(path)
+        try:
+            # One read transaction per shard pins a single snapshot of it
+            conn.execute('BEGIN')
+            for frame in iter_export_chunks(conn, chunk_size, completed_only, shard):
+                write_part(frame, out_dir, files, file_format)
+                rows += len(frame)
+                files += 1
+        finally:
+            conn.close()
+    return rows, files
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export pairs, features and results')
+    parser.add_argument('--db', default='data/compatibility.db', help='SQLite database path')
+    parser.add_argument('--shards', type=int, default=1, help="the app's SHARDS setting")
+    parser.add_argument('--out', default='exports', help='output directory')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='pairs per part file')
+    parser.add_argument('--completed-only', action='store_true',
+                        help='skip pairs still waiting for the partner')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    rows, files = export(args.db, args.out, args.format, args.chunk_size, args.completed_only,
+                         args.shards)
+    print(f"Exported {rows} pairs to {files} {args.format} files in {args.out} "
+          f"({time.perf_counter() - started:.1f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Report query plans for queries.sql and flag full scans and temp B-trees
+
+Usage:
+    python -m utils.index_advisor [--db data/compatibility.db] [--queries queries.sql]
+                                  [--strict]
+
+Every statement in the file is run through EXPLAIN QUERY PLAN on a
+read-only connection (statements are never executed). Plan steps that
+scan a whole table, or build a temporary B-tree for ORDER BY, GROUP BY or
+DISTINCT, are flagged. A scan through a covering index is reported but not
+flagged. Whole-table aggregates will always scan; the point is to catch
+per-pair lookups and listings that should use an index. With --strict the
+exit status is 1 when anything is flagged.
+"""
+import argparse
+import re
+import sqlite3
+import sys
+
+def split_statements(sql):
+    """(title, statement) pairs; the title is the nearest preceding '-- N. ...' comment"""
+    # Commented-out blocks (e.g. the cleanup DELETE) are not part of the workload
+    sql = re.sub(r'/\*.*?\*/', '', sql, flags=re.DOTALL)
+    statements = []
+    title = None
+    current = ''
+    for line in sql.splitlines(keepends=True):
+        if line.strip().startswith('--'):
+            heading = re.match(r'\s*--\s*(\d+[a-z]?\..*)', line)
+            if heading and not current.strip():
+                title = heading.group(1).strip()
+            continue
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip().rstrip(';').strip():
+                statements.append((title, current.strip()))
+            current = ''
+    return statements
+
+def flag_step(detail):
+    """Reason a plan step is a problem, or None"""
+    if detail.startswith('SCAN') and 'COVERING INDEX' not in detail:
+        return 'full scan in index order' if 'USING INDEX' in detail else 'full table scan'
+    if 'USE TEMP B-TREE' in detail:
+        return 'temp B-tree sort'
+    return None
+
+def explain(conn, statement):
+    """EXPLAIN QUERY PLAN rows as (detail, flag) pairs"""
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {statement}').fetchall()
+    return [(row[3], flag_step(row[3])) for row in rows]
+
+def advise(db_path, queries_path):
+    """Print the plan of every query; returns the number of flagged steps"""
+    with open(queries_path) as f:
+        statements = split_statements(f.read())
+    
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    flagged = 0
+    try:
+        for index, (title, statement) in enumerate(statements, 1):
+            print(f"[{title or f'statement {index}'}]")
+            for detail, flag in explain(conn, statement):
+                marker = '!!' if flag else '  '
+                print(f"  {marker} {detail}" + (f"  <- {flag}" if flag else ''))
+                flagged += bool(flag)
+    finally:
+        conn.close()
+    print(f"\n{flagged} flagged plan step(s) in {len(statements)} queries")
+    return flagged
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Flag scans and temp sorts in queries.sql')
+    parser.add_argument('--db', default='data/compatibility.db', help='SQLite database path')
+    parser.add_argument('--queries', default='queries.sql', help='SQL file to analyse')
+    parser.add_argument('--strict', action='store_true', help='exit 1 if anything is flagged')
+    args = parser.parse_args(argv)
+    
+    flagged = advise(args.db, args.queries)
+    return 1 if args.strict and flagged else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Lightweight in-process timing histograms with Prometheus text export
+
+Timings are recorded into fixed-bucket histograms labelled with the route
+of the current request (set by the app per request). Recording costs a lock
+and a bucket bisect, so it is cheap enough to leave on in production.
+Counters are per process; under gunicorn each worker reports its own.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# SQL statements slower than this are logged with their text
+SLOW_QUERY_SECONDS = 0.1
+
+HELP = {
+    'app_request_seconds': 'Request handling time by route',
+    'app_db_connect_seconds': 'Time to get a database connection',
+    'app_sql_seconds': 'SQL statement execution time',
+    'app_scoring_seconds': 'Compatibility scoring time',
+    'app_template_render_seconds': 'Template render time'
+}
+
+logger = logging.getLogger(__name__)
+
+current_route = ContextVar('current_route', default='-')
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds"""
+    
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+    
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+
+_histograms = {}
+_lock = threading.Lock()
+
+def observe(name, seconds, **labels):
+    """Record one duration; the current route is added as a label"""
+    labels.setdefault('route', current_route.get())
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+@contextmanager
+def timed(name, **labels):
+    """Context manager recording the duration of its block"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def observe_sql(sql, seconds):
+    """Record a statement under its leading keyword and log it if slow"""
+    words = sql.split(None, 1)
+    observe('app_sql_seconds', seconds, statement=words[0].upper() if words else '')
+    if seconds >= SLOW_QUERY_SECONDS:
+        logger.warning("Slow query (%.1f ms, route %s): %s", seconds * 1000,
+                       current_route.get(), ' '.join(sql.split()))
+
+def reset():
+    """Drop all recorded metrics"""
+    with _lock:
+        _histograms.clear()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    pairs = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return '{' + ','.join(pairs) + '}' if labels else ''
+
+def render_prometheus(gauges=None):
+    """
+    Render all histograms (and optional gauges) in Prometheus text format
+    
+    gauges: dict of metric name -> list of (labels dict, value)
+    """
+    with _lock:
+        snapshot = [(name, labels, list(h.counts), h.total)
+                    for (name, labels), h in sorted(_histograms.items())]
+    
+    lines = []
+    seen = set()
+    for name, labels, counts, total in snapshot:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    
+    for name, samples in (gauges or {}).items():
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {value}')
+    
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,307 @@
+"""
+Versioned schema migrations
+
+The schema version is stored in PRAGMA user_version. init_db calls
+migrate(), which applies every migration newer than the database, each in
+its own BEGIN IMMEDIATE transaction together with the version bump, so
+workers starting at the same time never apply one twice. Migrations are
+idempotent (IF NOT EXISTS, column checks) because databases created
+before this module have user_version 0 but already carry some of the
+schema.
+
+To change the schema, append a (version, description, function) entry to
+MIGRATIONS; never edit one that has shipped.
+"""
+import sqlite3
+
+def _execute_script(cursor, script):
+    """Run a multi-statement script inside the current transaction"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            cursor.execute(statement)
+            statement = ''
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+def _ensure_columns(cursor, table, columns):
+    """Add any missing columns to an existing table"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, col_type in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {col_type}')
+
+def _base_schema(cursor):
+    _execute_script(cursor, '''
+        -- Table: pair_links (stores generated links for couples)
+        CREATE TABLE IF NOT EXISTS pair_links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            link_token TEXT UNIQUE NOT NULL,
+            relationship_status TEXT NOT NULL,  -- 'married' or 'unmarried'
+            created_at TEXT NOT NULL,
+            is_complete INTEGER DEFAULT 0,
+            CONSTRAINT chk_status CHECK (relationship_status IN ('married', 'unmarried'))
+        );
+        
+        -- Table: questions (all questionnaire questions)
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_text TEXT NOT NULL,
+            domain TEXT NOT NULL,  -- e.g., 'communication', 'finance', 'intimacy'
+            gender_specific TEXT DEFAULT 'both',  -- 'male', 'female', or 'both'
+            CONSTRAINT chk_gender CHECK (gender_specific IN ('male', 'female', 'both'))
+        );
+        
+        -- Table: options (answer options for each question with weights)
+        CREATE TABLE IF NOT EXISTS options (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_id INTEGER NOT NULL,
+            option_text TEXT NOT NULL,
+            weight INTEGER NOT NULL,  -- numeric weight for ML model
+            FOREIGN KEY (question_id) REFERENCES questions(id)
+        );
+        
+        -- Table: responses (stores user answers)
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pair_id INTEGER NOT NULL,
+            user_number INTEGER NOT NULL,  -- 1 or 2
+            question_id INTEGER NOT NULL,
+            option_id INTEGER NOT NULL,
+            response_time TEXT NOT NULL,
+            FOREIGN KEY (pair_id) REFERENCES pair_links(id),
+            FOREIGN KEY (question_id) REFERENCES questions(id),
+            FOREIGN KEY (option_id) REFERENCES options(id),
+            CONSTRAINT chk_user CHECK (user_number IN (1, 2))
+        );
+        
+        -- Table: results (stores prediction results)
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pair_id INTEGER NOT NULL,
+            prediction_label TEXT NOT NULL,  -- e.g., 'High Compatibility', 'Divorce Risk'
+            probability_score REAL NOT NULL,
+            explanation TEXT,
+            predicted_at TEXT NOT NULL,
+            FOREIGN KEY (pair_id) REFERENCES pair_links(id)
+        );
+        
+        CREATE INDEX IF NOT EXISTS idx_link_token ON pair_links(link_token);
+        CREATE INDEX IF NOT EXISTS idx_responses_pair ON responses(pair_id);
+        CREATE INDEX IF NOT EXISTS idx_options_question ON options(question_id);
+    ''')
+
+def _result_versions(cursor):
+    _ensure_columns(cursor, 'results', {
+        'model_version': 'TEXT',
+        'user1_scores': 'TEXT',
+        'user2_scores': 'TEXT'
+    })
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_pair ON results(pair_id)')
+
+def _pair_outcomes(cursor):
+    _execute_script(cursor, '''
+        -- Table: pair_outcomes (known relationship outcomes used as training labels)
+        CREATE TABLE IF NOT EXISTS pair_outcomes (
+            pair_id INTEGER PRIMARY KEY,
+            outcome INTEGER NOT NULL,  -- 1 = relationship doing well, 0 = not
+            recorded_at TEXT NOT NULL,
+            FOREIGN KEY (pair_id) REFERENCES pair_links(id),
+            CONSTRAINT chk_outcome CHECK (outcome IN (0, 1))
+        );
+    ''')
+
+def _domain_scores(cursor):
+    has_domain_scores = _table_exists(cursor, 'pair_domain_scores')
+    _execute_script(cursor, '''
+        -- Table: pair_domain_scores (per-domain rollup of responses, kept in
+        -- step with every answer insert)
+        CREATE TABLE IF NOT EXISTS pair_domain_scores (
+            pair_id INTEGER NOT NULL,
+            user_number INTEGER NOT NULL,
+            domain TEXT NOT NULL,
+            score_sum INTEGER NOT NULL,
+            answer_count INTEGER NOT NULL,
+            PRIMARY KEY (pair_id, user_number, domain),
+            FOREIGN KEY (pair_id) REFERENCES pair_links(id)
+        ) WITHOUT ROWID;
+    ''')
+    
+    # Databases created before the rollup table get it filled once
+    if not has_domain_scores:
+        from utils.db_helper import rebuild_domain_scores
+        rebuild_domain_scores(cursor)
+
+def _catalog_versioning(cursor):
+    _execute_script(cursor, '''
+        -- Table: catalog_meta (bumped whenever questions/options change)
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 1);
+    ''')
+    
+    # Any write to the catalog tables invalidates cached catalogs
+    for table in ('questions', 'options'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+def _packed_responses(cursor):
+    _execute_script(cursor, '''
+        -- Table: packed_responses (one row per user with all answers packed
+        -- into a byte array; see utils/packed_storage.py)
+        CREATE TABLE IF NOT EXISTS packed_responses (
+            pair_id INTEGER NOT NULL,
+            user_number INTEGER NOT NULL,
+            answers BLOB NOT NULL,
+            response_time TEXT NOT NULL,
+            PRIMARY KEY (pair_id, user_number),
+            FOREIGN KEY (pair_id) REFERENCES pair_links(id),
+            CONSTRAINT chk_user CHECK (user_number IN (1, 2))
+        ) WITHOUT ROWID;
+    ''')
+
+def _analytics_indexes(cursor):
+    _execute_script(cursor, '''
+        -- link_token already has the UNIQUE constraint's index, and
+        -- (pair_id) is a prefix of the covering responses index
+        DROP INDEX IF EXISTS idx_link_token;
+        DROP INDEX IF EXISTS idx_responses_pair;
+        
+        -- Per-pair reads and per-user grouping without touching the table
+        CREATE INDEX IF NOT EXISTS idx_responses_pair_user
+            ON responses(pair_id, user_number, question_id, option_id);
+        
+        -- Listings ordered by creation/prediction time, and the pending-pair
+        -- queue (incomplete pairs by age)
+        CREATE INDEX IF NOT EXISTS idx_pair_links_created ON pair_links(created_at);
+        CREATE INDEX IF NOT EXISTS idx_pair_links_pending ON pair_links(is_complete, created_at);
+        CREATE INDEX IF NOT EXISTS idx_results_predicted ON results(predicted_at);
+    ''')
+
+def _drafts(cursor):
+    _execute_script(cursor, '''
+        -- Table: drafts (questionnaires in progress; see utils/drafts.py)
+        CREATE TABLE IF NOT EXISTS drafts (
+            id TEXT PRIMARY KEY,
+            form TEXT NOT NULL,  -- 'initiator' or the partner's link token
+            revision INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        
+        -- Table: draft_answers (latest answer per question of a draft)
+        CREATE TABLE IF NOT EXISTS draft_answers (
+            draft_id TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            option_id INTEGER NOT NULL,
+            PRIMARY KEY (draft_id, question_id),
+            FOREIGN KEY (draft_id) REFERENCES drafts(id)
+        ) WITHOUT ROWID;
+        
+        CREATE INDEX IF NOT EXISTS idx_drafts_updated ON drafts(updated_at);
+    ''')
+
+def _unique_responses(cursor):
+    # Racing partner submissions could store a user's answers twice; keep
+    # the first answer per question and recompute the affected rollups
+    cursor.execute('''
+        SELECT DISTINCT pair_id FROM responses
+        GROUP BY pair_id, user_number, question_id
+        HAVING COUNT(*) > 1
+    ''')
+    pair_ids = [row[0] for row in cursor.fetchall()]
+    if pair_ids:
+        cursor.execute('''
+            DELETE FROM responses
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM responses GROUP BY pair_id, user_number, question_id
+            )
+        ''')
+        from utils.db_helper import rebuild_domain_scores
+        for pair_id in pair_ids:
+            rebuild_domain_scores(cursor, pair_id)
+    
+    _execute_script(cursor, '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_responses_unique_answer
+            ON responses(pair_id, user_number, question_id);
+        
+        -- Per-pair and per-user reads use the unique index now; a second
+        -- index on the same leading columns only slows every insert
+        DROP INDEX IF EXISTS idx_responses_pair_user;
+    ''')
+
+def _unique_results(cursor):
+    # Concurrent first views of a pair could each insert a result; the
+    # latest row is the one that was being served
+    cursor.execute('''
+        DELETE FROM results
+        WHERE id NOT IN (SELECT MAX(id) FROM results GROUP BY pair_id)
+    ''')
+    _execute_script(cursor, '''
+        DROP INDEX IF EXISTS idx_results_pair;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_results_pair_unique ON results(pair_id);
+    ''')
+
+def _packed_layouts(cursor):
+    _ensure_columns(cursor, 'packed_responses', {'layout': 'TEXT'})
+    
+    # Blobs written so far follow the catalog as it is now; longer ones
+    # (questions since deleted) get no layout and are refused on decode
+    cursor.execute('SELECT pair_id, user_number, length(answers) FROM packed_responses')
+    rows = cursor.fetchall()
+    if rows:
+        from utils.db_helper import _load_catalog
+        from utils.packed_storage import layout
+        hashes = layout(_load_catalog(cursor.connection, None))['hashes']
+        cursor.executemany('''
+            UPDATE packed_responses SET layout = ? WHERE pair_id = ? AND user_number = ?
+        ''', [(hashes[length], pair_id, user_number)
+              for pair_id, user_number, length in rows if length < len(hashes)])
+
+MIGRATIONS = [
+    (1, 'base schema', _base_schema),
+    (2, 'model version and score columns on results', _result_versions),
+    (3, 'pair_outcomes training labels', _pair_outcomes),
+    (4, 'pair_domain_scores rollup', _domain_scores),
+    (5, 'catalog version triggers', _catalog_versioning),
+    (6, 'packed_responses storage', _packed_responses),
+    (7, 'composite and ordering indexes', _analytics_indexes),
+    (8, 'questionnaire drafts', _drafts),
+    (9, 'one answer per user and question', _unique_responses),
+    (10, 'one result per pair', _unique_results),
+    (11, 'layout hash on packed answers', _packed_layouts),
+]
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations; returns the list of versions applied"""
+    applied = []
+    for version, _, upgrade in MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            if schema_version(conn) < version:
+                upgrade(cursor)
+                cursor.execute(f'PRAGMA user_version = {version}')
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
@@ -1,10 +1,105 @@
 import numpy as np
+import json
 import pickle
 import os
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
+import threading
+import time
+
+from utils import metrics
+
+# Serving path only: sklearn is imported by utils.training, or implicitly
+# when load_model() unpickles a trained model.
+
+MODEL_DIR = 'models'
+
+# Label bands, explanation templates and problem-domain thresholds live in
+# data; bump its "version" whenever they change so stored results recompute
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring_rules.json')
+
+_model_cache = {}
+_model_lock = threading.Lock()
+
+def compile_rules(rules):
+    """
+    Compile the rule table into per-status sorted cut arrays
+    
+    Each status gets `cuts` (ascending min_score of every band after the
+    first) so a binary search maps a combined score to its band index.
+    """
+    statuses = {}
+    for status, config in rules['statuses'].items():
+        bands = sorted(config['bands'],
+                       key=lambda band: -np.inf if band['min_score'] is None else band['min_score'])
+        statuses[status] = {
+            'cuts': np.array([band['min_score'] for band in bands[1:]], dtype=np.float64),
+            'labels': np.array([band['label'] for band in bands], dtype=object),
+            'invert': config['invert_probability']
+        }
+    
+    explanations = {}
+    for config in rules['statuses'].values():
+        for band in config['bands']:
+            explanations[band['label']] = (band['explanation'],
+                                           band.get('with_problems', ''),
+                                           band.get('without_problems', ''))
+    
+    return {
+        'version': rules['version'],
+        'domains': list(rules['domains']),
+        'min_average': rules['problem_domain']['min_average'],
+        'max_difference': rules['problem_domain']['max_difference'],
+        'default_status': rules['default_status'],
+        'statuses': statuses,
+        'explanations': explanations,
+        'top_problem_count': rules['top_problem_count'],
+        'strengths': rules['strengths']
+    }
+
+def load_rules(path=RULES_PATH):
+    """Read and compile a rule table"""
+    with open(path) as f:
+        return compile_rules(json.load(f))
+
+RULES = load_rules()
+RULES_VERSION = RULES['version']
+DOMAINS = RULES['domains']
+
+# Column names for create_features / create_features_batch output
+FEATURE_NAMES = ([f'user1_{d}' for d in DOMAINS] + [f'user2_{d}' for d in DOMAINS] +
+                 [f'diff_{d}' for d in DOMAINS] +
+                 ['user1_total', 'user2_total', 'total_diff', 'avg_score'])
+
+def scores_to_matrix_batch(user1_scores, user2_scores):
+    """Pack two aligned sequences of domain -> score dicts into a (N, 2, len(DOMAINS)) array"""
+    return np.array([[[u1.get(d, 0) for d in DOMAINS], [u2.get(d, 0) for d in DOMAINS]]
+                     for u1, u2 in zip(user1_scores, user2_scores)],
+                    dtype=np.float64).reshape(-1, 2, len(DOMAINS))
+
+def scores_to_matrix(user1_scores, user2_scores):
+    """Pack two domain -> score dicts into a (1, 2, len(DOMAINS)) array"""
+    return scores_to_matrix_batch([user1_scores], [user2_scores])
+
+def _sum_domains(values):
+    """Sum over the last axis in domain order, matching Python's sum() exactly"""
+    total = np.zeros(values.shape[:-1])
+    for i in range(values.shape[-1]):
+        total = total + values[..., i]
+    return total
+
+def create_features_batch(scores):
+    """
+    Create feature matrix for N pairs from a (N, 2, len(DOMAINS)) score array
+    
+    Column layout matches create_features: user 1 scores, user 2 scores,
+    absolute differences, both totals, total difference and average total.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    user1, user2 = scores[:, 0], scores[:, 1]
+    diffs = np.abs(user1 - user2)
+    totals = _sum_domains(scores)
+    total_diff = _sum_domains(diffs)
+    avg_score = (totals[:, 0] + totals[:, 1]) / 2
+    return np.column_stack([user1, user2, diffs, totals, total_diff, avg_score])
 
 def create_features(user1_scores, user2_scores):
     """
@@ -16,59 +111,149 @@ def create_features(user1_scores, user2_scores):
     - Total scores for each user
     - Similarity score (inverse of total difference)
     """
-    domains = ['communication', 'trust', 'finance', 'intimacy', 
-               'family', 'personal_growth', 'commitment']
-    
-    features = []
+    return create_features_batch(scores_to_matrix(user1_scores, user2_scores))
+
+def _apply_bands(compiled, rows, combined, labels, probabilities):
+    """Resolve label and probability for the selected rows by binary search"""
+    band_index = np.searchsorted(compiled['cuts'], combined[rows], side='right')
+    labels[rows] = compiled['labels'][band_index]
+    probabilities[rows] = 1 - combined[rows] if compiled['invert'] else combined[rows]
+
+def score_batch(scores, statuses, model=None):
+    """
+    Score N pairs at once
     
-    # Individual scores
-    for domain in domains:
-        features.append(user1_scores.get(domain, 0))
+    Parameters:
+    - scores: array of shape (N, 2, len(DOMAINS)) with per-domain averages
+    - statuses: one relationship status or a sequence of N statuses;
+      statuses missing from the rule table use its default_status
+    - model: optional trained classifier; its positive-class probability
+      replaces the rule-based combined score
     
-    for domain in domains:
-        features.append(user2_scores.get(domain, 0))
+    Returns:
+    - labels: (N,) object array of prediction labels
+    - probabilities: (N,) float array in 0-1 (risk for married couples)
+    - problem_mask: (N, len(DOMAINS)) bool array of problem domains
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n_pairs, n_domains = scores.shape[0], scores.shape[2]
+    user1, user2 = scores[:, 0], scores[:, 1]
     
-    # Differences (absolute)
-    for domain in domains:
-        diff = abs(user1_scores.get(domain, 0) - user2_scores.get(domain, 0))
-        features.append(diff)
+    # Similarity (lower difference = higher compatibility)
+    diffs = np.abs(user1 - user2)
+    similarity = 1 - _sum_domains(diffs) / (n_domains * 4)
     
-    # Total scores
-    total_user1 = sum(user1_scores.values())
-    total_user2 = sum(user2_scores.values())
-    features.append(total_user1)
-    features.append(total_user2)
+    # Combined score (weighted average of absolute scores and similarity)
+    totals = _sum_domains(scores)
+    total = totals[:, 0] + totals[:, 1]
+    combined = (total / (n_domains * 8)) * 0.6 + similarity * 0.4
+    if model is not None:
+        combined = model.predict_proba(create_features_batch(scores))[:, 1]
     
-    # Total difference (dissimilarity)
-    total_diff = sum(abs(user1_scores.get(d, 0) - user2_scores.get(d, 0)) for d in domains)
-    features.append(total_diff)
+    # Problem areas (low scores or big differences)
+    problem_mask = ((user1 + user2) / 2 < RULES['min_average']) | (diffs > RULES['max_difference'])
     
-    # Average score
-    avg_score = (total_user1 + total_user2) / 2
-    features.append(avg_score)
+    statuses = np.broadcast_to(np.asarray(statuses, dtype=object), (n_pairs,))
+    unmatched = np.ones(n_pairs, dtype=bool)
+    labels = np.empty(n_pairs, dtype=object)
+    probabilities = np.empty(n_pairs, dtype=np.float64)
+    for status, compiled in RULES['statuses'].items():
+        if status == RULES['default_status']:
+            continue
+        rows = statuses == status
+        unmatched &= ~rows
+        _apply_bands(compiled, rows, combined, labels, probabilities)
+    _apply_bands(RULES['statuses'][RULES['default_status']], unmatched, combined,
+                 labels, probabilities)
     
-    return np.array(features).reshape(1, -1)
+    return labels, probabilities, problem_mask
 
-def train_model():
+def train_model(*args, **kwargs):
     """
-    Train a machine learning model
-    In production, this would use real data
-    For now, we'll create a simple rule-based predictor
+    Train a machine learning model (see utils.training)
+    Imported lazily so serving never pays for sklearn
     """
-    # This is a placeholder - in real scenario, you'd load training data
-    # and train a proper model
-    pass
+    from utils.training import train_model as _train_model
+    return _train_model(*args, **kwargs)
 
-def load_model():
+def load_model(model_dir=MODEL_DIR):
     """
-    Load trained model from disk
+    Load trained model from disk, once per process
     Returns None if model doesn't exist (we'll use rule-based prediction)
+    
+    The current artifact is named by models/current.json and memory-mapped,
+    so forked workers share its pages. A legacy compatibility_model.pkl is
+    still honoured.
     """
-    model_path = 'models/compatibility_model.pkl'
-    if os.path.exists(model_path):
-        with open(model_path, 'rb') as f:
-            return pickle.load(f)
-    return None
+    cached = _model_cache.get(model_dir)
+    if cached is not None:
+        return cached[0]
+    
+    with _model_lock:
+        if model_dir in _model_cache:
+            return _model_cache[model_dir][0]
+        
+        model, metadata = None, None
+        current_path = os.path.join(model_dir, 'current.json')
+        legacy_path = os.path.join(model_dir, 'compatibility_model.pkl')
+        if os.path.exists(current_path):
+            import joblib
+            with open(current_path) as f:
+                metadata = json.load(f)
+            model = joblib.load(os.path.join(model_dir, metadata['artifact']), mmap_mode='r')
+        elif os.path.exists(legacy_path):
+            with open(legacy_path, 'rb') as f:
+                model = pickle.load(f)
+            metadata = {'version': 'legacy-pkl'}
+        
+        _model_cache[model_dir] = (model, metadata)
+        return model
+
+def get_model_version(model_dir=MODEL_DIR):
+    """Version of the active scorer: the trained artifact (if any) and the rule set"""
+    load_model(model_dir)
+    metadata = _model_cache[model_dir][1]
+    # Labels and explanations always come from the rule table
+    return f"{metadata['version']}+{RULES_VERSION}" if metadata else RULES_VERSION
+
+def reset_model_cache():
+    """Forget loaded models so the next load_model() rereads the artifact"""
+    with _model_lock:
+        _model_cache.clear()
+
+def explain_prediction(prediction, problem_domains):
+    """Build the explanation text for a prediction label and its problem domains"""
+    template, with_problems, without_problems = RULES['explanations'][prediction]
+    strength_domains = [d for d in DOMAINS if d not in problem_domains]
+    values = {
+        'problems': ', '.join(problem_domains),
+        'top_problems': ', '.join(problem_domains[:RULES['top_problem_count']]),
+        'strength_count': len(DOMAINS) - len(problem_domains),
+        'domain_count': len(DOMAINS)
+    }
+    
+    parts = [template.format(**values),
+             (with_problems if problem_domains else without_problems).format(**values)]
+    if strength_domains:
+        parts.append(RULES['strengths'].format(strengths=', '.join(strength_domains)))
+    return ''.join(parts)
+
+def predict_batch(scores, statuses, model=None):
+    """
+    Predict N pairs from a (N, 2, len(DOMAINS)) score array
+    
+    Returns a list of (prediction, probability percent, explanation) tuples,
+    formatted exactly like predict_compatibility.
+    """
+    started = time.perf_counter()
+    labels, probabilities, problem_mask = score_batch(scores, statuses, model)
+    predictions = []
+    for label, probability, mask in zip(labels, probabilities.tolist(), problem_mask):
+        problem_domains = [d for d, is_problem in zip(DOMAINS, mask) if is_problem]
+        predictions.append((label, round(probability * 100, 1),
+                            explain_prediction(label, problem_domains)))
+    metrics.observe('app_scoring_seconds', time.perf_counter() - started)
+    return predictions
 
 def predict_compatibility(user1_scores, user2_scores, relationship_status):
     """
@@ -84,93 +269,8 @@ def predict_compatibility(user1_scores, user2_scores, relationship_status):
     - probability: float (0-1)
     - explanation: string explanation
     """
-    
-    domains = ['communication', 'trust', 'finance', 'intimacy', 
-               'family', 'personal_growth', 'commitment']
-    
-    # Calculate metrics
-    total_user1 = sum(user1_scores.values())
-    total_user2 = sum(user2_scores.values())
-    avg_score = (total_user1 + total_user2)
-    max_possible = len(domains) * 4 * 2  # max score per domain * 2 users
-    
-    # Calculate similarity (lower difference = higher compatibility)
-    total_diff = sum(abs(user1_scores.get(d, 0) - user2_scores.get(d, 0)) for d in domains)
-    max_diff = len(domains) * 4
-    similarity = 1 - (total_diff / max_diff)
-    
-    # Combined score (weighted average of absolute scores and similarity)
-    combined_score = (avg_score / (len(domains) * 8)) * 0.6 + similarity * 0.4
-    
-    # Identify problem areas (low scores or big differences)
-    problem_domains = []
-    for domain in domains:
-        avg_domain = (user1_scores.get(domain, 0) + user2_scores.get(domain, 0)) / 2
-        diff = abs(user1_scores.get(domain, 0) - user2_scores.get(domain, 0))
-        
-        if avg_domain < 2.5 or diff > 2:
-            problem_domains.append(domain)
-    
-    # Generate prediction based on relationship status
-    if relationship_status == 'unmarried':
-        # Compatibility prediction for unmarried couples
-        if combined_score >= 0.75:
-            prediction = "Excellent Compatibility"
-            probability = combined_score
-            explanation = f"You both show strong alignment across {len(domains) - len(problem_domains)} out of {len(domains)} key relationship domains. "
-            if problem_domains:
-                explanation += f"Consider discussing: {', '.join(problem_domains)} for even better harmony."
-            else:
-                explanation += "Keep nurturing your connection!"
-        elif combined_score >= 0.60:
-            prediction = "Good Compatibility"
-            probability = combined_score
-            explanation = f"You have a solid foundation with good alignment in most areas. "
-            if problem_domains:
-                explanation += f"Work together on: {', '.join(problem_domains)} to strengthen your relationship."
-        elif combined_score >= 0.45:
-            prediction = "Moderate Compatibility"
-            probability = combined_score
-            explanation = f"Your relationship has potential, but requires effort. "
-            explanation += f"Focus on improving: {', '.join(problem_domains[:3])} through open communication and compromise."
-        else:
-            prediction = "Low Compatibility"
-            probability = combined_score
-            explanation = f"Significant differences detected in: {', '.join(problem_domains)}. "
-            explanation += "Consider couples counseling or have honest conversations about long-term compatibility."
-    
-    else:  # married
-        # Divorce risk prediction for married couples
-        if combined_score >= 0.70:
-            prediction = "Low Divorce Risk"
-            probability = 1 - combined_score  # inverse for risk
-            explanation = f"Your marriage shows strong health across key areas. "
-            if problem_domains:
-                explanation += f"Continue working on: {', '.join(problem_domains)} to maintain this positive trajectory."
-            else:
-                explanation += "Keep investing in your relationship!"
-        elif combined_score >= 0.55:
-            prediction = "Moderate Divorce Risk"
-            probability = 1 - combined_score
-            explanation = f"Your marriage has areas of concern. "
-            explanation += f"Priority areas to address: {', '.join(problem_domains[:3])}. Consider marriage counseling to strengthen your bond."
-        elif combined_score >= 0.40:
-            prediction = "High Divorce Risk"
-            probability = 1 - combined_score
-            explanation = f"Your marriage shows significant stress in: {', '.join(problem_domains)}. "
-            explanation += "Professional intervention is strongly recommended. Many marriages can be saved with proper support."
-        else:
-            prediction = "Critical Divorce Risk"
-            probability = 1 - combined_score
-            explanation = f"Your marriage faces serious challenges across multiple domains: {', '.join(problem_domains)}. "
-            explanation += "Immediate professional help is crucial. Both partners must be committed to making changes."
-    
-    # Add specific domain insights
-    strength_domains = [d for d in domains if d not in problem_domains]
-    if strength_domains:
-        explanation += f"\n\nStrengths: {', '.join(strength_domains)}."
-    
-    return prediction, round(probability * 100, 1), explanation
+    return predict_batch(scores_to_matrix(user1_scores, user2_scores), relationship_status,
+                         load_model())[0]
 
 def get_recommendation(prediction, relationship_status):
     """Generate actionable recommendations based on prediction"""
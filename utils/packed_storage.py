@@ -0,0 +1,278 @@
+"""
+Packed answer storage: one BLOB per user instead of one row per answer
+
+Usage:
+    python -m utils.packed_storage pack [--db data/compatibility.db] [--chunk-size 5000]
+    python -m utils.packed_storage unpack [--db data/compatibility.db] [--chunk-size 5000]
+
+With RESPONSE_STORAGE = 'packed', each user's answers are stored in
+packed_responses as a byte array with one uint8 per question, in question
+ID order. A byte is the index of the chosen option within its question
+(options in ID order), or UNANSWERED. The pair_domain_scores rollup is
+maintained exactly as for row storage, so scoring never decodes blobs.
+
+The layout follows the current catalog, and each row records a hash of
+the layout its blob was written under (the question and option IDs of
+its first len(blob) questions). Adding questions is safe: older blobs
+are shorter, keep their hash and decode the new questions as unanswered.
+Deleting or reordering questions, or changing a question's options,
+changes the hash, and such blobs are refused (ValueError) rather than
+decoded to the wrong answers, so unpack to rows first. `pack` and
+`unpack` move existing data between the two formats in chunks; unpack
+before running row-based analytics such as queries.sql.
+"""
+import argparse
+import hashlib
+from collections import defaultdict
+
+import numpy as np
+
+from utils.db_helper import get_db_connection, get_catalog, rebuild_domain_scores
+
+UNANSWERED = 255
+
+def layout(catalog):
+    """Position/option lookup tables for a catalog (computed once per catalog)"""
+    cached = catalog.get('packed_layout')
+    if cached is not None:
+        return cached
+    
+    questions = catalog['questions']
+    width = max([len(q['options']) for q in questions] + [1])
+    if width >= UNANSWERED:
+        raise ValueError(f"Packed storage supports at most {UNANSWERED - 1} options per question")
+    option_ids = np.full((len(questions), width), -1, dtype=np.int64)
+    weights = np.zeros((len(questions), width), dtype=np.int64)
+    codes = {}
+    for position, question in enumerate(questions):
+        for index, option in enumerate(question['options']):
+            option_ids[position, index] = option['id']
+            weights[position, index] = option['weight']
+            codes[option['id']] = (position, index)
+    result = {
+        'question_ids': np.array([q['id'] for q in questions], dtype=np.int64),
+        'domains': [q['domain'] for q in questions],
+        'option_ids': option_ids,
+        'weights': weights,
+        'codes': codes,
+        'hashes': _prefix_hashes(questions)
+    }
+    catalog['packed_layout'] = result
+    return result
+
+def _prefix_hashes(questions):
+    """Layout hash of the first n questions, for every n from 0 to len(questions)"""
+    digest = hashlib.sha256()
+    hashes = [digest.hexdigest()[:16]]
+    for question in questions:
+        option_ids = ','.join(str(option['id']) for option in question['options'])
+        digest.update(f"{question['id']}:{option_ids};".encode('ascii'))
+        hashes.append(digest.hexdigest()[:16])
+    return hashes
+
+def layout_hash(catalog, blob):
+    """Hash of the layout a blob of this length follows under catalog"""
+    hashes = layout(catalog)['hashes']
+    return hashes[len(blob)] if len(blob) < len(hashes) else None
+
+def _decode(catalog, blob, blob_layout):
+    """Byte array of a stored blob, refused if written under another layout"""
+    if blob_layout is None or blob_layout != layout_hash(catalog, blob):
+        raise ValueError("Packed answers were written under a different catalog layout; "
+                         "restore that catalog and unpack them before editing questions")
+    return np.frombuffer(blob, dtype=np.uint8)
+
+def pack_answers(catalog, answers, existing=None, existing_layout=None):
+    """Encode (question_id, option_id) pairs, merged over an existing blob"""
+    info = layout(catalog)
+    packed = np.full(len(info['question_ids']), UNANSWERED, dtype=np.uint8)
+    if existing:
+        previous = _decode(catalog, existing, existing_layout)
+        packed[:len(previous)] = previous
+    for _, option_id in answers:
+        position, index = info['codes'][option_id]
+        packed[position] = index
+    return packed.tobytes()
+
+def unpack_answers(catalog, blob, blob_layout):
+    """Decode a blob back into (question_id, option_id) pairs in question order"""
+    info = layout(catalog)
+    packed = _decode(catalog, blob, blob_layout)
+    positions = np.flatnonzero(packed != UNANSWERED)
+    option_ids = info['option_ids'][positions, packed[positions]]
+    return list(zip(info['question_ids'][positions].tolist(), option_ids.tolist()))
+
+def domain_totals(catalog, blob, blob_layout):
+    """Sum and count of option weights per domain for one packed blob"""
+    info = layout(catalog)
+    packed = _decode(catalog, blob, blob_layout)
+    positions = np.flatnonzero(packed != UNANSWERED)
+    weights = info['weights'][positions, packed[positions]]
+    totals = {}
+    for position, weight in zip(positions.tolist(), weights.tolist()):
+        domain = info['domains'][position]
+        score_sum, answer_count = totals.get(domain, (0, 0))
+        totals[domain] = (score_sum + weight, answer_count + 1)
+    return totals
+
+def add_domain_scores(cursor, catalog, pair_id=None):
+    """Fold packed answers into pair_domain_scores (used by rebuild_domain_scores)"""
+    # Until migration 11 adds the layout column, blobs follow the current catalog
+    cursor.execute('PRAGMA table_info(packed_responses)')
+    has_layout = any(row[1] == 'layout' for row in cursor.fetchall())
+    sql = f"SELECT pair_id, user_number, answers, {'layout' if has_layout else 'NULL'} FROM packed_responses"
+    if pair_id is None:
+        cursor.execute(sql)
+    else:
+        cursor.execute(sql + ' WHERE pair_id = ?', (pair_id,))
+    rows = []
+    for row_pair_id, user_number, blob, blob_layout in cursor.fetchall():
+        if not has_layout:
+            blob_layout = layout_hash(catalog, blob)
+        rows.extend((row_pair_id, user_number, domain, score_sum, answer_count)
+                    for domain, (score_sum, answer_count)
+                    in domain_totals(catalog, blob, blob_layout).items())
+    cursor.executemany('''
+        INSERT INTO pair_domain_scores (pair_id, user_number, domain, score_sum, answer_count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (pair_id, user_number, domain) DO UPDATE
+        SET score_sum = score_sum + excluded.score_sum,
+            answer_count = answer_count + excluded.answer_count
+    ''', rows)
+
+def write_packed(cursor, catalog, pair_id, user_number, answers, response_time):
+    """
+    Store answers for one user, merging with anything already stored
+    
+    Returns the (question_id, option_id) answers the new ones replaced, so
+    the caller can take their weights out of the rollup.
+    """
+    cursor.execute('''
+        SELECT answers, layout FROM packed_responses WHERE pair_id = ? AND user_number = ?
+    ''', (pair_id, user_number))
+    existing, existing_layout = cursor.fetchone() or (None, None)
+    replaced = []
+    if existing:
+        previous = dict(unpack_answers(catalog, existing, existing_layout))
+        replaced = [(question_id, previous[question_id]) for question_id, _ in answers
+                    if question_id in previous]
+    blob = pack_answers(catalog, answers, existing, existing_layout)
+    cursor.execute('''
+        INSERT INTO packed_responses (pair_id, user_number, answers, response_time, layout)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (pair_id, user_number) DO UPDATE
+        SET answers = excluded.answers, layout = excluded.layout
+    ''', (pair_id, user_number, blob, response_time, layout_hash(catalog, blob)))
+    return replaced
+
+def packed_rows(cursor, catalog, pair_id):
+    """Packed answers for a pair expanded to response-like dicts"""
+    cursor.execute('''
+        SELECT user_number, answers, response_time, layout
+        FROM packed_responses
+        WHERE pair_id = ?
+        ORDER BY user_number
+    ''', (pair_id,))
+    rows = []
+    for user_number, blob, response_time, blob_layout in cursor.fetchall():
+        for question_id, option_id in unpack_answers(catalog, blob, blob_layout):
+            option = catalog['options'][option_id]
+            rows.append({
+                'pair_id': pair_id,
+                'user_number': user_number,
+                'question_id': question_id,
+                'option_id': option_id,
+                'response_time': response_time,
+                'domain': option['domain'],
+                'weight': option['weight']
+            })
+    return rows
+
+def _pair_chunks(cursor, table, chunk_size):
+    """(first, last) pair_id ranges covering `table` in chunks of pairs"""
+    cursor.execute(f'SELECT DISTINCT pair_id FROM {table} ORDER BY pair_id')
+    pair_ids = [row[0] for row in cursor.fetchall()]
+    for start in range(0, len(pair_ids), chunk_size):
+        chunk = pair_ids[start:start + chunk_size]
+        yield chunk[0], chunk[-1]
+
+def pack(db_path, chunk_size=5000):
+    """Move row-format answers into packed_responses; returns users migrated"""
+    catalog = get_catalog(db_path)
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    migrated = 0
+    duplicates = False
+    try:
+        for first, last in list(_pair_chunks(cursor, 'responses', chunk_size)):
+            cursor.execute('''
+                SELECT pair_id, user_number, question_id, option_id, response_time
+                FROM responses
+                WHERE pair_id BETWEEN ? AND ?
+                ORDER BY id
+            ''', (first, last))
+            users = defaultdict(list)
+            times = {}
+            for pair_id, user_number, question_id, option_id, response_time in cursor.fetchall():
+                users[(pair_id, user_number)].append((question_id, option_id))
+                times.setdefault((pair_id, user_number), response_time)
+            for (pair_id, user_number), answers in users.items():
+                duplicates |= len({q for q, _ in answers}) != len(answers)
+                write_packed(cursor, catalog, pair_id, user_number, answers,
+                             times[(pair_id, user_number)])
+            cursor.execute('DELETE FROM responses WHERE pair_id BETWEEN ? AND ?', (first, last))
+            conn.commit()
+            migrated += len(users)
+    
+        # A repeated answer keeps only its latest option once packed
+        if duplicates:
+            rebuild_domain_scores(cursor)
+            conn.commit()
+    finally:
+        conn.close()
+    return migrated
+
+def unpack(db_path, chunk_size=5000):
+    """Move packed answers back into row-format responses; returns users migrated"""
+    catalog = get_catalog(db_path)
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    migrated = 0
+    try:
+        for first, last in list(_pair_chunks(cursor, 'packed_responses', chunk_size)):
+            cursor.execute('''
+                SELECT pair_id, user_number, answers, response_time, layout
+                FROM packed_responses
+                WHERE pair_id BETWEEN ? AND ?
+            ''', (first, last))
+            rows = []
+            users = cursor.fetchall()
+            for pair_id, user_number, blob, response_time, blob_layout in users:
+                rows.extend((pair_id, user_number, question_id, option_id, response_time)
+                            for question_id, option_id
+                            in unpack_answers(catalog, blob, blob_layout))
+            cursor.executemany('''
+                INSERT INTO responses (pair_id, user_number, question_id, option_id, response_time)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.execute('DELETE FROM packed_responses WHERE pair_id BETWEEN ? AND ?',
+                           (first, last))
+            conn.commit()
+            migrated += len(users)
+    finally:
+        conn.close()
+    return migrated
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert answers between row and packed storage')
+    parser.add_argument('direction', choices=['pack', 'unpack'])
+    parser.add_argument('--db', default='data/compatibility.db', help='SQLite database path')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='pairs per transaction')
+    args = parser.parse_args(argv)
+    
+    migrate = pack if args.direction == 'pack' else unpack
+    migrated = migrate(args.db, args.chunk_size)
+    print(f"Done: {args.direction}ed answers for {migrated} users")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+In-process cache for rendered pages and fragments
+
+Pages that are identical for every visitor with the same inputs are stored
+once per key, together with precompressed gzip (and brotli, when the
+optional brotli package is installed) bodies and a content hash ETag. Keys
+include the catalog version, so editing questions or options naturally
+misses the cache.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Rendered pages/fragments kept per process (least recently used evicted)
+MAX_ENTRIES = 256
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+def _get_or_create(key, create):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            return entry
+    
+    entry = create()
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return entry
+
+def get_fragment(key, render):
+    """Rendered HTML string for key, calling render() on a miss"""
+    return _get_or_create(('fragment',) + key, render)
+
+def get_page(key, render):
+    """
+    Cached page entry for key, calling render() on a miss
+    
+    Entries hold 'body' (UTF-8), 'gzip', 'br' (None without brotli) and
+    'etag' (unquoted content hash).
+    """
+    def create():
+        body = render().encode('utf-8')
+        return {
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=6, mtime=0),
+            'br': brotli.compress(body) if brotli else None,
+            'etag': hashlib.sha1(body).hexdigest()[:20]
+        }
+    return _get_or_create(('page',) + key, create)
+
+def clear():
+    """Drop every cached page and fragment"""
+    with _lock:
+        _entries.clear()
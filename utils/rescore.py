@@ -0,0 +1,198 @@
+"""
+Recompute predictions for every completed pair in the database
+
+Usage:
+    python -m utils.rescore [--db data/compatibility.db] [--shards 1] [--chunk-size 5000]
+                            [--workers 4] [--checkpoint data/rescore.checkpoint]
+                            [--restart]
+
+Completed pairs are streamed in pair_id order. Domain averages are read
+from the pair_domain_scores rollup, each chunk is scored with the batch scorer (optionally in
+worker processes) and written back with executemany in one transaction per
+chunk. The last committed pair_id is written to the checkpoint file so an
+interrupted run resumes where it stopped. With --shards N every shard is
+rescored in turn, each with its own checkpoint file (pair_id is per shard).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+
+from utils.db_helper import get_db_connection
+from utils.ml_model import get_model_version, load_model, predict_batch, scores_to_matrix_batch
+from utils.result_store import load_domain_scores, save_results_batch
+from utils.storage import shard_paths
+
+def read_checkpoint(path):
+    """Last committed pair_id, or 0 when starting fresh"""
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    return 0
+
+def write_checkpoint(path, pair_id):
+    """Atomically record the last committed pair_id"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(pair_id))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def shard_checkpoint(checkpoint, shard, shards):
+    """Checkpoint file for one shard (the file itself when unsharded)"""
+    if not checkpoint or shards <= 1:
+        return checkpoint
+    return f'{checkpoint}.shard{shard}'
+
+def iter_chunks(conn, start_after, chunk_size):
+    """
+    Yield (pair_ids, statuses, user1_scores, user2_scores) for completed pairs
+    
+    Domain averages for the whole chunk come from one rollup query.
+    """
+    cursor = conn.cursor()
+    last_id = start_after
+    while True:
+        cursor.execute('''
+            SELECT id, relationship_status
+            FROM pair_links
+            WHERE is_complete = 1 AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, chunk_size))
+        pairs = cursor.fetchall()
+        if not pairs:
+            return
+        
+        pair_ids = [p['id'] for p in pairs]
+        statuses = [p['relationship_status'] for p in pairs]
+        user1_scores, user2_scores = load_domain_scores(cursor, pair_ids)
+        
+        yield pair_ids, statuses, user1_scores, user2_scores
+        last_id = pair_ids[-1]
+
+def score_chunk(chunk):
+    """Score one chunk; runs in a worker process when --workers > 1"""
+    import numpy as np
+    
+    pair_ids, statuses, user1_scores, user2_scores = chunk
+    scores = scores_to_matrix_batch(user1_scores, user2_scores)
+    return chunk, predict_batch(scores, np.asarray(statuses), load_model())
+
+def write_chunk(conn, chunk, predictions):
+    """Write one scored chunk in a single transaction"""
+    pair_ids, statuses, user1_scores, user2_scores = chunk
+    cursor = conn.cursor()
+    model_version = get_model_version()
+    
+    rows = []
+    for i, (prediction, probability, explanation) in enumerate(predictions):
+        result = {
+            'prediction': prediction,
+            'probability': probability,
+            'explanation': explanation,
+            'user1_scores': user1_scores[i],
+            'user2_scores': user2_scores[i],
+            'model_version': model_version
+        }
+        rows.append((pair_ids[i], result))
+    
+    save_results_batch(cursor, rows)
+    conn.commit()
+
+class _Ready:
+    """Stand-in for AsyncResult when scoring inline"""
+    def __init__(self, value):
+        self.value = value
+    
+    def get(self):
+        return self.value
+
+def rescore(db_path, chunk_size=5000, workers=1, checkpoint=None, progress=sys.stderr):
+    """Rescore all completed pairs after the checkpoint; returns the number rescored"""
+    start_after = read_checkpoint(checkpoint)
+    
+    conn = get_db_connection(db_path)
+    total = conn.execute('SELECT COUNT(*) FROM pair_links WHERE is_complete = 1 AND id > ?',
+                         (start_after,)).fetchone()[0]
+    # Reads stream from a second connection so per-chunk commits don't end them
+    read_conn = get_db_connection(db_path)
+    pool = Pool(workers) if workers > 1 else None
+    # Keep a few chunks in flight per worker; reads and writes stay on this thread
+    pending = deque()
+    
+    done = 0
+    started = time.perf_counter()
+    
+    def commit_next():
+        nonlocal done
+        chunk, predictions = pending.popleft().get()
+        write_chunk(conn, chunk, predictions)
+        if checkpoint:
+            write_checkpoint(checkpoint, chunk[0][-1])
+        done += len(predictions)
+        elapsed = time.perf_counter() - started
+        print(f"Rescored {done}/{total} pairs ({done / elapsed:.0f} pairs/s)", file=progress)
+    
+    try:
+        for chunk in iter_chunks(read_conn, start_after, chunk_size):
+            if pool:
+                pending.append(pool.apply_async(score_chunk, (chunk,)))
+            else:
+                pending.append(_Ready(score_chunk(chunk)))
+            if len(pending) > workers * 2:
+                commit_next()
+        while pending:
+            commit_next()
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+        read_conn.close()
+        conn.close()
+    
+    return done
+
+def rescore_shards(db_path, shards, chunk_size=5000, workers=1, checkpoint=None,
+                   progress=sys.stderr):
+    """Rescore every shard in turn; returns the number rescored"""
+    done = 0
+    for shard, path in enumerate(shard_paths(db_path, shards)):
+        if shards > 1:
+            print(f"Shard {shard}: {path}", file=progress)
+        done += rescore(path, chunk_size, workers, shard_checkpoint(checkpoint, shard, shards),
+                        progress)
+    return done
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recompute predictions for completed pairs')
+    parser.add_argument('--db', default='data/compatibility.db', help='SQLite database path')
+    parser.add_argument('--shards', type=int, default=1, help="the app's SHARDS setting")
+    parser.add_argument('--chunk-size', type=int, default=5000, help='pairs per transaction')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='scoring worker processes')
+    parser.add_argument('--checkpoint', default='data/rescore.checkpoint',
+                        help='file recording the last committed pair_id')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    args = parser.parse_args(argv)
+    
+    checkpoints = [shard_checkpoint(args.checkpoint, shard, args.shards)
+                   for shard in range(max(args.shards, 1))]
+    if args.restart:
+        for path in checkpoints:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    done = rescore_shards(args.db, args.shards, args.chunk_size, args.workers, args.checkpoint)
+    print(f"Done: {done} pairs rescored with model {get_model_version()}")
+    
+    # A finished run starts from scratch next time
+    for path in checkpoints:
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == '__main__':
+    main()
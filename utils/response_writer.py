@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+
+from utils.db_helper import get_db_connection, get_catalog
+from utils.packed_storage import write_packed
+
+# Where answers are stored: 'rows' (responses) or 'packed' (packed_responses)
+STORAGE_MODES = ('rows', 'packed')
+
+def parse_answers(form, catalog):
+    """
+    Parse q_<question_id> = <option_id> fields into (question_id, option_id) pairs
+    
+    Every option must exist in the catalog and belong to its question, and
+    each question may be answered once. Raises ValueError on malformed,
+    mismatched or repeated answers.
+    """
+    options = catalog['options']
+    answers = []
+    answered = set()
+    for key, value in form.items():
+        if not key.startswith('q_'):
+            continue
+        try:
+            question_id = int(key[2:])
+            option_id = int(value)
+        except ValueError:
+            raise ValueError(f"Malformed answer field {key}")
+        
+        option = options.get(option_id)
+        if option is None or option['question_id'] != question_id:
+            raise ValueError(f"Option {option_id} does not belong to question {question_id}")
+        # q_5 and q_05 name the same question
+        if question_id in answered:
+            raise ValueError(f"More than one option for question {question_id}")
+        answered.add(question_id)
+        answers.append((question_id, option_id))
+    return answers
+
+def domain_totals(catalog, answers):
+    """Sum and count of option weights per domain for a list of answers"""
+    totals = {}
+    for _, option_id in answers:
+        option = catalog['options'][option_id]
+        score_sum, answer_count = totals.get(option['domain'], (0, 0))
+        totals[option['domain']] = (score_sum + option['weight'], answer_count + 1)
+    return totals
+
+def write_responses(cursor, catalog, pair_id, user_number, answers, response_time=None,
+                    storage='rows'):
+    """
+    Insert all answers for one user with a single executemany (caller commits)
+    
+    storage='packed' stores them as one packed_responses row instead. The
+    pair_domain_scores rollup is updated in the same transaction either way,
+    with the weights the database holds in that transaction.
+    """
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown response storage {storage!r}")
+    if response_time is None:
+        response_time = datetime.now().isoformat()
+    if storage == 'packed':
+        replaced = write_packed(cursor, catalog, pair_id, user_number, answers, response_time)
+        # A re-answered question's old weight leaves the rollup
+        _add_domain_scores(cursor, pair_id, user_number, replaced, -1)
+    else:
+        cursor.executemany('''
+            INSERT INTO responses (pair_id, user_number, question_id, option_id, response_time)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(pair_id, user_number, question_id, option_id, response_time)
+              for question_id, option_id in answers])
+    _add_domain_scores(cursor, pair_id, user_number, answers)
+
+def _add_domain_scores(cursor, pair_id, user_number, answers, sign=1):
+    """Add (sign=-1: remove) answers' weights to the rollup, as stored right now"""
+    if not answers:
+        return
+    # Weights come from this transaction, not the cached catalog, which can
+    # be up to CATALOG_RECHECK_SECONDS behind a weight edit
+    cursor.execute('''
+        INSERT INTO pair_domain_scores (pair_id, user_number, domain, score_sum, answer_count)
+        SELECT ?, ?, q.domain, ? * SUM(o.weight), ? * COUNT(*)
+        FROM json_each(?) a
+        JOIN options o ON o.id = a.value
+        JOIN questions q ON q.id = o.question_id
+        WHERE true
+        GROUP BY q.domain
+        ON CONFLICT (pair_id, user_number, domain) DO UPDATE
+        SET score_sum = score_sum + excluded.score_sum,
+            answer_count = answer_count + excluded.answer_count
+    ''', (pair_id, user_number, sign, sign,
+          json.dumps([option_id for _, option_id in answers])))
+
+def save_responses(db_path, pair_id, user_number, answers, response_time=None, storage='rows'):
+    """Save a batch of answers in one transaction (bulk imports and scripts)"""
+    catalog = get_catalog(db_path)
+    conn = get_db_connection(db_path)
+    try:
+        write_responses(conn.cursor(), catalog, pair_id, user_number, answers, response_time,
+                        storage)
+        conn.commit()
+    finally:
+        conn.close()
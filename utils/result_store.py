@@ -0,0 +1,178 @@
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from utils.db_helper import get_db_connection
+from utils.ml_model import predict_compatibility, get_model_version
+
+# Number of rendered results kept in memory per process
+RESULT_CACHE_SIZE = 1024
+
+_result_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(key):
+    with _cache_lock:
+        result = _result_cache.get(key)
+        if result is not None:
+            _result_cache.move_to_end(key)
+        return result
+
+def _cache_put(key, result):
+    with _cache_lock:
+        _result_cache[key] = result
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+def clear_result_cache():
+    """Drop all in-memory results"""
+    with _cache_lock:
+        _result_cache.clear()
+
+def compute_domain_scores(cursor, pair_id):
+    """Average option weight per domain for both users of a pair"""
+    cursor.execute('''
+        SELECT user_number, domain, score_sum, answer_count
+        FROM pair_domain_scores
+        WHERE pair_id = ?
+    ''', (pair_id,))
+    
+    user1_scores = {}
+    user2_scores = {}
+    for row in cursor.fetchall():
+        if row['answer_count'] > 0:
+            scores = user1_scores if row['user_number'] == 1 else user2_scores
+            scores[row['domain']] = row['score_sum'] / row['answer_count']
+    
+    return user1_scores, user2_scores
+
+def load_domain_scores(cursor, pair_ids):
+    """
+    Per-domain averages for many pairs, read from the pair_domain_scores rollup
+    
+    pair_ids must be sorted ascending. Returns (user1_scores, user2_scores),
+    two lists of domain -> score dicts aligned with pair_ids.
+    """
+    index = {pair_id: i for i, pair_id in enumerate(pair_ids)}
+    user1_scores = [{} for _ in pair_ids]
+    user2_scores = [{} for _ in pair_ids]
+    if not pair_ids:
+        return user1_scores, user2_scores
+    
+    cursor.execute('''
+        SELECT pair_id, user_number, domain, score_sum, answer_count
+        FROM pair_domain_scores
+        WHERE pair_id BETWEEN ? AND ?
+    ''', (pair_ids[0], pair_ids[-1]))
+    for row in cursor.fetchall():
+        i = index.get(row['pair_id'])
+        if i is None or row['answer_count'] == 0:
+            continue
+        scores = user1_scores if row['user_number'] == 1 else user2_scores
+        scores[i][row['domain']] = row['score_sum'] / row['answer_count']
+    
+    return user1_scores, user2_scores
+
+# Results are unique per pair: writing one replaces the pair's previous result
+UPSERT_RESULT = '''
+    INSERT INTO results (prediction_label, probability_score, explanation, predicted_at,
+                         model_version, user1_scores, user2_scores, pair_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (pair_id) DO UPDATE
+    SET prediction_label = excluded.prediction_label,
+        probability_score = excluded.probability_score,
+        explanation = excluded.explanation,
+        predicted_at = excluded.predicted_at,
+        model_version = excluded.model_version,
+        user1_scores = excluded.user1_scores,
+        user2_scores = excluded.user2_scores
+'''
+
+def _result_values(pair_id, result, predicted_at):
+    return (result['prediction'], result['probability'], result['explanation'],
+            predicted_at, result['model_version'],
+            json.dumps(result['user1_scores']), json.dumps(result['user2_scores']), pair_id)
+
+def save_result(cursor, pair_id, result):
+    """Insert or replace the result row of a pair"""
+    cursor.execute(UPSERT_RESULT, _result_values(pair_id, result, datetime.now().isoformat()))
+
+def save_results_batch(cursor, rows):
+    """
+    Bulk version of save_result
+    
+    rows: iterable of (pair_id, result)
+    """
+    predicted_at = datetime.now().isoformat()
+    cursor.executemany(UPSERT_RESULT, [_result_values(pair_id, result, predicted_at)
+                                       for pair_id, result in rows])
+
+def get_result(db_path, link_token):
+    """
+    Return the prediction for a pair, computing it at most once per model version
+    
+    Lookups go LRU -> the pair's persisted results row -> fresh computation.
+    Results for incomplete pairs are computed but never persisted or cached.
+    Returns None for an unknown link_token.
+    """
+    key = (db_path, link_token)
+    model_version = get_model_version()
+    result = _cache_get(key)
+    if result is not None and result['model_version'] == model_version:
+        return result
+    
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT pl.id AS pair_id, pl.relationship_status, pl.is_complete,
+               r.prediction_label, r.probability_score, r.explanation,
+               r.model_version, r.user1_scores, r.user2_scores
+        FROM pair_links pl
+        LEFT JOIN results r ON r.pair_id = pl.id
+        WHERE pl.link_token = ?
+    ''', (link_token,))
+    row = cursor.fetchone()
+    
+    if row is None:
+        conn.close()
+        return None
+    
+    if row['model_version'] == model_version:
+        conn.close()
+        result = {
+            'prediction': row['prediction_label'],
+            'probability': row['probability_score'],
+            'explanation': row['explanation'],
+            'status': row['relationship_status'],
+            'user1_scores': json.loads(row['user1_scores']),
+            'user2_scores': json.loads(row['user2_scores']),
+            'model_version': row['model_version']
+        }
+        _cache_put(key, result)
+        return result
+    
+    status = row['relationship_status']
+    user1_scores, user2_scores = compute_domain_scores(cursor, row['pair_id'])
+    prediction, probability, explanation = predict_compatibility(
+        user1_scores, user2_scores, status
+    )
+    result = {
+        'prediction': prediction,
+        'probability': probability,
+        'explanation': explanation,
+        'status': status,
+        'user1_scores': user1_scores,
+        'user2_scores': user2_scores,
+        'model_version': model_version
+    }
+    
+    if row['is_complete']:
+        save_result(cursor, row['pair_id'], result)
+        conn.commit()
+        _cache_put(key, result)
+    
+    conn.close()
+    return result
@@ -0,0 +1,106 @@
+"""
+Batch scoring for the /api/v1/score endpoint
+
+Each item in {"pairs": [...]} carries an optional "id", a "status" and the
+two partners' answers, either as domain-score dicts ("user1"/"user2") or as
+raw option IDs ("user1_options"/"user2_options"). Valid items are scored in
+one vectorized call; invalid ones produce a per-item error line.
+"""
+import json
+
+import numpy as np
+
+from utils.ml_model import (DOMAINS, RULES, explain_prediction, load_model, score_batch,
+                            scores_to_matrix_batch)
+from utils.response_writer import domain_totals
+
+# Largest request body and number of pairs accepted per call
+MAX_REQUEST_BYTES = 5 * 1024 * 1024
+MAX_PAIRS = 10000
+
+MAX_DOMAIN_SCORE = 4
+
+def _domain_scores(item, user, catalog):
+    """Domain averages for one partner from either accepted input format"""
+    if f'{user}_options' in item:
+        return _scores_from_options(item[f'{user}_options'], catalog)
+    scores = item.get(user)
+    if not isinstance(scores, dict):
+        raise ValueError(f"{user} must be a domain-score object or {user}_options a list")
+    for domain, score in scores.items():
+        if domain not in DOMAINS:
+            raise ValueError(f"Unknown domain {domain!r} for {user}")
+        if isinstance(score, bool) or not isinstance(score, (int, float)) \
+                or not 0 <= score <= MAX_DOMAIN_SCORE:
+            raise ValueError(f"{user}.{domain} must be a number from 0 to {MAX_DOMAIN_SCORE}")
+    return scores
+
+def _scores_from_options(option_ids, catalog):
+    if not isinstance(option_ids, list):
+        raise ValueError("Option IDs must be a list")
+    answers = []
+    answered = set()
+    for option_id in option_ids:
+        # JSON true/false would otherwise pass as options 1/0
+        is_id = isinstance(option_id, int) and not isinstance(option_id, bool)
+        option = catalog['options'].get(option_id) if is_id else None
+        if option is None:
+            raise ValueError(f"Unknown option {option_id!r}")
+        if option['question_id'] in answered:
+            raise ValueError(f"More than one option for question {option['question_id']}")
+        answered.add(option['question_id'])
+        answers.append((option['question_id'], option_id))
+    return {domain: score_sum / answer_count
+            for domain, (score_sum, answer_count) in domain_totals(catalog, answers).items()}
+
+def parse_pairs(pairs, catalog):
+    """
+    Validate request items
+    
+    Returns (items, errors): items is a list of (index, id, status, user1, user2)
+    for valid pairs, errors maps item index -> error message.
+    """
+    items = []
+    errors = {}
+    for index, item in enumerate(pairs):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Each pair must be an object")
+            status = item.get('status')
+            # Lists and objects aren't hashable; check the type before the lookup
+            if not isinstance(status, str) or status not in RULES['statuses']:
+                raise ValueError(f"status must be one of {', '.join(RULES['statuses'])}")
+            items.append((index, item.get('id', index), status,
+                          _domain_scores(item, 'user1', catalog),
+                          _domain_scores(item, 'user2', catalog)))
+        except ValueError as e:
+            errors[index] = str(e)
+    return items, errors
+
+def score_pairs(pairs, catalog):
+    """Yield one NDJSON line per request item, in request order"""
+    items, errors = parse_pairs(pairs, catalog)
+    
+    results = {}
+    if items:
+        scores = scores_to_matrix_batch([u1 for _, _, _, u1, _ in items],
+                                        [u2 for _, _, _, _, u2 in items])
+        statuses = np.array([status for _, _, status, _, _ in items], dtype=object)
+        labels, probabilities, problem_mask = score_batch(scores, statuses, load_model())
+        for i, (index, item_id, _, _, _) in enumerate(items):
+            problem_domains = [d for d, is_problem in zip(DOMAINS, problem_mask[i]) if is_problem]
+            results[index] = {
+                'id': item_id,
+                'prediction': labels[i],
+                'probability': round(float(probabilities[i]) * 100, 1),
+                'explanation': explain_prediction(labels[i], problem_domains),
+                'problem_domains': problem_domains
+            }
+    
+    for index, item in enumerate(pairs):
+        if index in results:
+            line = results[index]
+        else:
+            item_id = item.get('id', index) if isinstance(item, dict) else index
+            line = {'id': item_id, 'error': errors[index]}
+        yield json.dumps(line) + '\n'
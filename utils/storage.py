@@ -0,0 +1,150 @@
+"""
+Shard routing for pair data
+
+With SHARDS = 1 (the default) everything lives in app.config['DATABASE'],
+exactly as before. With SHARDS = N, each pair and everything that belongs
+to it (responses, rollups, results, journal, compaction) lives in one of
+N SQLite files chosen by crc32(link_token) % N, so writes for different
+pairs no longer queue on a single database lock. The link token is known
+at every entry point, so no lookup table is needed.
+
+The question catalog stays in the primary database and is read from
+there (get_catalog(primary)). Shards keep a synced copy so that per-shard
+SQL joins (rebuild_domain_scores, queries.sql) and the write-behind drain
+see the same questions; sync_catalogs() copies it at startup and again
+whenever the primary's catalog version changes. Changing N moves pairs
+between shards, so choose it before going live.
+
+Cross-shard analytics go through fan_out(), which runs one query on every
+shard in parallel over read-only connections. pair_id is per file, so
+rows combined from several shards are keyed by (shard, pair_id). The
+rescore, export and training CLIs take --db (the primary) and --shards
+and cover every shard; compaction takes --db and is run once per file,
+including the primary, which holds the questionnaire drafts.
+"""
+import os
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.db_helper import (BUSY_TIMEOUT_MS, init_db, get_catalog, get_read_connection,
+                             invalidate_catalog, rebuild_domain_scores)
+
+# Primary catalog version last copied to the shards, per primary (this process)
+_synced_versions = {}
+_sync_lock = threading.Lock()
+
+def shard_paths(db_path, shards):
+    """Database files holding pair data: the primary itself, or N shard files"""
+    if shards <= 1:
+        return [db_path]
+    root, ext = os.path.splitext(db_path)
+    return [f'{root}-shard{i}{ext}' for i in range(shards)]
+
+def database_paths(db_path, shards):
+    """Every database file: the primary (catalog, drafts) followed by the shards"""
+    paths = shard_paths(db_path, shards)
+    return paths if db_path in paths else [db_path] + paths
+
+def shard_index(link_token, shards):
+    """Stable shard number for a link token"""
+    return zlib.crc32(link_token.encode('utf-8')) % shards if shards > 1 else 0
+
+def pair_database(db_path, shards, link_token):
+    """Database file that owns the pair behind link_token"""
+    return shard_paths(db_path, shards)[shard_index(link_token, shards)]
+
+def sync_catalog(primary_path, shard_path):
+    """
+    Copy questions and options from the primary into a shard if they differ
+    
+    The shard's rollups are rebuilt in the same transaction when a weight or
+    domain changed.
+    """
+    conn = sqlite3.connect(f'file:{shard_path}', uri=True, isolation_level=None,
+                           timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute('ATTACH DATABASE ? AS primary_db', (f'file:{primary_path}?mode=ro',))
+        # Compare and copy under the shard's write lock, so processes starting
+        # (or noticing a catalog edit) together copy at most once
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            differs = conn.execute('''
+                SELECT EXISTS (SELECT * FROM primary_db.questions EXCEPT SELECT * FROM main.questions)
+                    OR EXISTS (SELECT * FROM main.questions EXCEPT SELECT * FROM primary_db.questions)
+                    OR EXISTS (SELECT * FROM primary_db.options EXCEPT SELECT * FROM main.options)
+                    OR EXISTS (SELECT * FROM main.options EXCEPT SELECT * FROM primary_db.options)
+            ''').fetchone()[0]
+            # Rollups built with a changed weight or domain must be rebuilt
+            reweighted = differs and conn.execute('''
+                SELECT EXISTS (
+                    SELECT 1 FROM main.options o
+                    JOIN main.questions q ON q.id = o.question_id
+                    JOIN primary_db.options po ON po.id = o.id
+                    JOIN primary_db.questions pq ON pq.id = po.question_id
+                    WHERE po.weight IS NOT o.weight OR pq.domain IS NOT q.domain
+                )
+            ''').fetchone()[0]
+            if differs:
+                conn.execute('DELETE FROM main.options')
+                conn.execute('DELETE FROM main.questions')
+                conn.execute('INSERT INTO main.questions SELECT * FROM primary_db.questions')
+                conn.execute('INSERT INTO main.options SELECT * FROM primary_db.options')
+            if reweighted:
+                rebuild_domain_scores(conn.cursor())
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return bool(differs)
+    finally:
+        conn.close()
+
+def sync_catalogs(db_path, shards, version):
+    """
+    Bring every shard's catalog in line with the primary's
+    
+    version is the primary's current catalog version (get_catalog()['version']);
+    the shards are compared only when it differs from the last one synced by
+    this process, so calling this per request costs a dict lookup.
+    """
+    if shards <= 1 or _synced_versions.get(db_path) == version:
+        return
+    with _sync_lock:
+        if _synced_versions.get(db_path) == version:
+            return
+        for path in shard_paths(db_path, shards):
+            if sync_catalog(db_path, path):
+                invalidate_catalog(path)
+        _synced_versions[db_path] = version
+
+def init_storage(db_path, shards):
+    """Create or migrate the primary database and every shard"""
+    init_db(db_path)
+    if shards <= 1:
+        return
+    for path in shard_paths(db_path, shards):
+        init_db(path)
+    sync_catalogs(db_path, shards, get_catalog(db_path)['version'])
+
+def fan_out(db_path, shards, sql, params=()):
+    """
+    Run one read-only query on every shard in parallel
+    
+    Returns a list of (shard_index, rows). Merging (summing counts,
+    re-sorting, ...) is up to the caller, since only it knows what the
+    query means.
+    """
+    paths = shard_paths(db_path, shards)
+    
+    def query(path):
+        conn = get_read_connection(path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+    
+    with ThreadPoolExecutor(len(paths)) as pool:
+        return list(enumerate(pool.map(query, paths)))
@@ -0,0 +1,129 @@
+"""
+Train the compatibility model from labeled pairs
+
+Usage:
+    python -m utils.training [--db data/compatibility.db] [--shards 1]
+                             [--model-dir models] [--n-estimators 200]
+
+Labels come from pair_outcomes (1 = relationship doing well), gathered
+from every shard. Features use the create_features layout, built in bulk
+from each shard's pair_domain_scores rollup. The fitted model is written as an uncompressed joblib
+artifact (so it can be memory-mapped) with a metadata JSON next to it, and
+models/current.json is switched to it atomically. Running servers pick the
+new model up on restart.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+from utils.db_helper import get_read_connection
+from utils.ml_model import DOMAINS, MODEL_DIR, create_features_batch, scores_to_matrix_batch
+from utils.result_store import load_domain_scores
+from utils.storage import fan_out, shard_paths
+
+# Pairs aggregated per SQL query while building the feature matrix
+CHUNK_SIZE = 10000
+
+def load_training_data(db_path, shards=1):
+    """Feature matrix and labels for every completed pair with a recorded outcome"""
+    labeled_by_shard = fan_out(db_path, shards, '''
+        SELECT pl.id, po.outcome
+        FROM pair_links pl
+        JOIN pair_outcomes po ON po.pair_id = pl.id
+        WHERE pl.is_complete = 1
+        ORDER BY pl.id
+    ''')
+    
+    features = []
+    outcomes = []
+    paths = shard_paths(db_path, shards)
+    for shard, labeled in labeled_by_shard:
+        # pair_ids are per shard: features come from the shard that owns them
+        conn = get_read_connection(paths[shard])
+        cursor = conn.cursor()
+        try:
+            for start in range(0, len(labeled), CHUNK_SIZE):
+                pair_ids = [row['id'] for row in labeled[start:start + CHUNK_SIZE]]
+                user1_scores, user2_scores = load_domain_scores(cursor, pair_ids)
+                features.append(create_features_batch(
+                    scores_to_matrix_batch(user1_scores, user2_scores)))
+        finally:
+            conn.close()
+        outcomes.extend(row['outcome'] for row in labeled)
+    
+    if not features:
+        return np.empty((0, len(DOMAINS) * 3 + 4)), np.empty(0, dtype=np.int64)
+    return np.vstack(features), np.array(outcomes, dtype=np.int64)
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def train_model(db_path='data/compatibility.db', model_dir=MODEL_DIR, n_estimators=200,
+                test_size=0.2, random_state=42, shards=1):
+    """
+    Fit a random forest on all labeled pairs and publish it as the current model
+    
+    Returns the artifact metadata. Raises ValueError without both outcomes.
+    """
+    import joblib
+    
+    X, y = load_training_data(db_path, shards)
+    if len(np.unique(y)) < 2:
+        raise ValueError("Training needs labeled pairs with both outcomes in pair_outcomes")
+    
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=random_state
+    )
+    
+    model = RandomForestClassifier(n_estimators=n_estimators, n_jobs=-1,
+                                   random_state=random_state)
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+    # Serving scores one pair per call from every worker thread; a pool
+    # across all cores per predict_proba would only add overhead
+    model.set_params(n_jobs=1)
+    
+    version = datetime.now().strftime('v%Y%m%d%H%M%S')
+    artifact = f'compatibility_model-{version}.joblib'
+    os.makedirs(model_dir, exist_ok=True)
+    # Uncompressed so load_model() can memory-map the tree arrays
+    joblib.dump(model, os.path.join(model_dir, artifact))
+    
+    metadata = {
+        'version': version,
+        'artifact': artifact,
+        'trained_at': datetime.now().isoformat(),
+        'n_samples': int(len(y)),
+        'n_features': int(X.shape[1]),
+        'n_estimators': n_estimators,
+        'test_accuracy': float(model.score(X_test, y_test)),
+        'fit_seconds': round(fit_seconds, 3)
+    }
+    _write_json(os.path.join(model_dir, f'compatibility_model-{version}.json'), metadata)
+    _write_json(os.path.join(model_dir, 'current.json'), metadata)
+    return metadata
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the compatibility model')
+    parser.add_argument('--db', default='data/compatibility.db', help='SQLite database path')
+    parser.add_argument('--shards', type=int, default=1, help="the app's SHARDS setting")
+    parser.add_argument('--model-dir', default=MODEL_DIR, help='artifact directory')
+    parser.add_argument('--n-estimators', type=int, default=200)
+    args = parser.parse_args(argv)
+    
+    metadata = train_model(args.db, args.model_dir, args.n_estimators, shards=args.shards)
+    print(f"Trained {metadata['version']} on {metadata['n_samples']} pairs in "
+          f"{metadata['fit_seconds']}s (test accuracy {metadata['test_accuracy']:.3f})")
+
+if __name__ == '__main__':
+    main()
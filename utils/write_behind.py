@@ -0,0 +1,256 @@
+"""
+Write-behind journal for questionnaire submissions
+
+With WRITE_BEHIND enabled, submit handlers append the validated answers to
+an append-only JSONL journal next to the database and return immediately.
+A background thread per process drains the journal into pair_links,
+responses and the domain rollups in one transaction per batch.
+
+- append() fsyncs before returning (and fsyncs the directory when the
+  journal is new or was just emptied), so an acknowledged submission
+  survives a crash; a torn trailing line (crash mid-write) was never
+  acknowledged and is dropped.
+- All processes share one journal, serialized with flock, so a partner
+  request served by another worker still sees the submission.
+- flush() is idempotent: pairs whose link already exists and partner
+  entries for links that are already complete are skipped, so replaying
+  a journal whose batch committed just before a crash, or a partner who
+  submitted twice, is harmless. It runs at startup
+  (recovery) and before any read of a pending link (read-through).
+- append() refuses entries the database would reject. flush() applies
+  each entry under its own savepoint, and an entry that still fails (a
+  line that isn't JSON, or a partner entry whose link was deleted while
+  it waited) is moved to a dead-letter file next to the journal, with the
+  reason, instead of holding up the rest. Only errors of the database
+  itself (locked, disk I/O) leave the whole batch journaled for a retry.
+"""
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from utils.db_helper import get_db_connection, get_catalog
+from utils.response_writer import STORAGE_MODES, write_responses
+
+# Relationship statuses pair_links accepts
+PAIR_STATUSES = ('married', 'unmarried')
+
+# Seconds between background drains
+DRAIN_INTERVAL = 0.5
+
+logger = logging.getLogger(__name__)
+
+_drainers = {}
+_drainers_pid = None
+_drainers_lock = threading.Lock()
+
+def journal_path(db_path):
+    return db_path + '.writebehind.jsonl'
+
+def dead_letter_path(db_path):
+    return db_path + '.writebehind.failed.jsonl'
+
+def has_pending(db_path):
+    """Cheap check (one stat) for undrained entries"""
+    try:
+        return os.path.getsize(journal_path(db_path)) > 0
+    except FileNotFoundError:
+        return False
+
+def validate(entry):
+    """Raise ValueError for an entry that could never be applied"""
+    if entry['op'] == 'pair' and entry.get('status') not in PAIR_STATUSES:
+        raise ValueError(f"Invalid relationship status {entry.get('status')!r}")
+    if entry.get('storage', 'rows') not in STORAGE_MODES:
+        raise ValueError(f"Unknown response storage {entry.get('storage')!r}")
+    question_ids = [question_id for question_id, _ in entry['answers']]
+    if len(set(question_ids)) != len(question_ids):
+        raise ValueError("More than one option for a question")
+
+def _fsync_directory(path):
+    """Make a new file's directory entry durable"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_durably(f, data):
+    """Append to a file opened with 'a' and fsync; the caller holds the journal's flock"""
+    # Empty means just created (or just drained): the file itself may not
+    # be on disk until its directory is synced too
+    created = os.fstat(f.fileno()).st_size == 0
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+    if created:
+        _fsync_directory(f.name)
+
+def append(db_path, entry):
+    """Durably append one entry and make sure this process has a drainer running"""
+    validate(entry)
+    entry.setdefault('recorded_at', datetime.now().isoformat())
+    line = json.dumps(entry, separators=(',', ':')) + '\n'
+    with open(journal_path(db_path), 'a') as journal:
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        _write_durably(journal, line)
+    _ensure_drainer(db_path)
+
+def submit_pair(db_path, link_token, status, answers, storage='rows'):
+    """Journal the first partner's submission (creates the pair on drain)"""
+    append(db_path, {'op': 'pair', 'link_token': link_token, 'status': status,
+                     'answers': answers, 'storage': storage})
+
+def submit_partner(db_path, link_token, answers, storage='rows'):
+    """Journal the second partner's submission (completes the pair on drain)"""
+    append(db_path, {'op': 'partner', 'link_token': link_token, 'answers': answers,
+                     'storage': storage})
+
+def _read_entries(journal):
+    """(line, entry) for each complete line; entry is None if the line isn't valid JSON"""
+    entries = []
+    for line in journal.read().splitlines(keepends=True):
+        if not line.endswith('\n'):
+            logger.warning("Dropping torn write-behind entry: %r", line[:80])
+            break
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            entry = None
+        entries.append((line, entry if isinstance(entry, dict) else None))
+    return entries
+
+def _dead_letter(db_path, failed):
+    """Durably set aside (journal line, reason) pairs that can't be applied"""
+    failed_at = datetime.now().isoformat()
+    with open(dead_letter_path(db_path), 'a') as dead_letters:
+        _write_durably(dead_letters, ''.join(
+            json.dumps({'failed_at': failed_at, 'reason': reason, 'line': line.rstrip('\n')}) + '\n'
+            for line, reason in failed
+        ))
+
+def _apply(cursor, catalog, entry):
+    """Apply one journal entry; returns False if it was already applied"""
+    # Options deleted from the catalog since submission can't be scored
+    answers = [(question_id, option_id) for question_id, option_id in entry['answers']
+               if option_id in catalog['options']]
+    recorded_at = entry['recorded_at']
+    storage = entry.get('storage', 'rows')
+    
+    cursor.execute('SELECT id FROM pair_links WHERE link_token = ?', (entry['link_token'],))
+    row = cursor.fetchone()
+    
+    if entry['op'] == 'pair':
+        if row is not None:
+            return False
+        cursor.execute('''
+            INSERT INTO pair_links (link_token, relationship_status, created_at, is_complete)
+            VALUES (?, ?, ?, ?)
+        ''', (entry['link_token'], entry['status'], recorded_at, 0))
+        write_responses(cursor, catalog, cursor.lastrowid, 1, answers, recorded_at, storage)
+        return True
+    
+    if row is None:
+        # Compacted or deleted while the entry waited in the journal
+        raise LookupError(f"Unknown link {entry['link_token']}")
+    # Claim the link; a completed pair (double submit, replay) is skipped
+    cursor.execute('UPDATE pair_links SET is_complete = 1 WHERE id = ? AND is_complete = 0',
+                   (row['id'],))
+    if cursor.rowcount == 0:
+        return False
+    write_responses(cursor, catalog, row['id'], 2, answers, recorded_at, storage)
+    return True
+
+def flush(db_path):
+    """
+    Drain every journaled entry into the database in one transaction
+    
+    Returns the number of entries applied. Entries are removed from the
+    journal only after the transaction commits; entries that fail on their
+    own are moved to the dead-letter file.
+    """
+    if not has_pending(db_path):
+        return 0
+    
+    with open(journal_path(db_path), 'r+') as journal:
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        entries = _read_entries(journal)
+        applied = 0
+        failed = []
+        if entries:
+            catalog = get_catalog(db_path)
+            conn = get_db_connection(db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                for line, entry in entries:
+                    if entry is None:
+                        logger.error("Dead-lettering unreadable write-behind entry: %r",
+                                     line[:80])
+                        failed.append((line, 'Not a JSON object'))
+                        continue
+                    cursor.execute('SAVEPOINT entry')
+                    try:
+                        validate(entry)
+                        applied += _apply(cursor, catalog, entry)
+                    except sqlite3.OperationalError:
+                        raise
+                    except Exception as exc:
+                        logger.exception("Dead-lettering write-behind entry for link %s",
+                                         entry.get('link_token'))
+                        cursor.execute('ROLLBACK TO entry')
+                        failed.append((line, f'{type(exc).__name__}: {exc}'))
+                    cursor.execute('RELEASE entry')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        if failed:
+            _dead_letter(db_path, failed)
+        journal.seek(0)
+        journal.truncate()
+        journal.flush()
+        os.fsync(journal.fileno())
+    return applied
+
+def read_through(db_path):
+    """Flush before a read so pending submissions are visible"""
+    if has_pending(db_path):
+        flush(db_path)
+
+def _drain_loop(db_path, stop):
+    while not stop.wait(DRAIN_INTERVAL):
+        try:
+            flush(db_path)
+        except Exception:
+            logger.exception("Write-behind drain failed; entries stay journaled")
+
+def _ensure_drainer(db_path):
+    global _drainers_pid
+    with _drainers_lock:
+        # Threads don't survive a fork; children start their own drainers
+        if _drainers_pid != os.getpid():
+            _drainers.clear()
+            _drainers_pid = os.getpid()
+        if db_path in _drainers:
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_drain_loop, args=(db_path, stop),
+                                  name='write-behind', daemon=True)
+        thread.start()
+        _drainers[db_path] = (thread, stop)
+
+def stop_drainers():
+    """Stop background drainers and flush what they left behind"""
+    with _drainers_lock:
+        drainers = dict(_drainers) if _drainers_pid == os.getpid() else {}
+        _drainers.clear()
+    for db_path, (thread, stop) in drainers.items():
+        stop.set()
+        thread.join()
+        flush(db_path)